@@ -0,0 +1,137 @@
+import re
+import threading
+from email_processor import EmailSender
+from rate_limiter import RateLimiter
+
+
+# 服务商对发件账户限流（发送过于频繁、超出发送频率）时4xx回复中常见的关键字
+THROTTLE_PATTERN = re.compile(
+    r'rate|frequen|throttl|quota|sending limit|limit exceeded|too many (?:messages|mails|emails)|'
+    r'频繁|频率|额度|上限',
+    re.IGNORECASE
+)
+THROTTLE_CODES = (421, 450, 451)
+# 5xx回复只有明确指出发件账户的发送额度用尽时才算，例如Gmail的550 5.4.5 Daily user sending quota exceeded
+SENDING_QUOTA_PATTERN = re.compile(
+    r'sending (?:quota|limit)|(?:daily|hourly) (?:\w+ )*(?:quota|limit)|(?:发送|发信)(?:额度|上限|数量|频率)',
+    re.IGNORECASE
+)
+SENDING_QUOTA_CODES = (550, 554)
+# 针对单封邮件或收件人的错误（邮件过大、收件人邮箱已满等），不能据此停用发件账户
+NOT_QUOTA_PATTERN = re.compile(
+    r'size|too large|mailbox|recipient|user unknown|storage|邮件过大|收件人|邮箱已满|容量',
+    re.IGNORECASE
+)
+
+
+def account_sections(config):
+    """配置文件中的发件账户节：[EMAIL]以及所有[EMAIL:名称]"""
+    sections = []
+    if config.has_section('EMAIL'):
+        sections.append('EMAIL')
+    sections.extend(s for s in config.sections() if s.startswith('EMAIL:'))
+    return sections
+
+
+def is_quota_error(error):
+    """
+    判断SendError是否表示发件账户的额度用尽或被服务商限流，是则该账户应退出轮换
+    邮件过大（552）、收件人邮箱已满等针对单封邮件的错误不算
+    """
+    message = str(error)
+    if NOT_QUOTA_PATTERN.search(message):
+        return False
+    if error.code in THROTTLE_CODES:
+        return bool(THROTTLE_PATTERN.search(message))
+    if error.code in SENDING_QUOTA_CODES:
+        return bool(SENDING_QUOTA_PATTERN.search(message))
+    return False
+
+
+class SenderAccount:
+    """轮换中的一个发件账户"""
+
+    def __init__(self, sender, rate_limiter):
+        self.sender = sender
+        self.name = sender.section
+        self.weight = max(sender.weight, 0)
+        self.rate_limiter = rate_limiter
+        self.active = self.weight > 0
+        self.disabled_reason = ''
+        # 平滑加权轮询的当前权重
+        self.current_weight = 0
+
+
+class AccountRotation:
+    """
+    多账户轮换：按权重把邮件分配给各发件账户，每个账户使用各自的限速额度
+    认证失败或额度用尽的账户自动退出轮换
+    """
+
+    def __init__(self, accounts):
+        if not accounts:
+            raise ValueError("配置文件中没有可用的发件账户")
+        self.accounts = accounts
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_file, sender_class=EmailSender):
+        """为配置文件中的每个账户节创建发送器，sender_class可为EmailSender或AsyncEmailSender"""
+        primary = sender_class(config_file)
+        accounts = []
+        for section in account_sections(primary.config):
+            sender = primary if section == 'EMAIL' else sender_class(config_file, section)
+            limiter = RateLimiter.from_config(sender.config, sender.smtp_server, section=section)
+            accounts.append(SenderAccount(sender, limiter))
+        return cls(accounts)
+
+    @property
+    def active_accounts(self):
+        return [account for account in self.accounts if account.active]
+
+    def choose(self, available=None):
+        """
+        平滑加权轮询选择下一个账户
+        available: 可选的过滤函数，例如跳过发送队列已满的账户；没有合适账户时返回None
+        """
+        with self._lock:
+            candidates = [
+                account for account in self.accounts
+                if account.active and (available is None or available(account))
+            ]
+            if not candidates:
+                return None
+            total = sum(account.weight for account in candidates)
+            for account in candidates:
+                account.current_weight += account.weight
+            best = max(candidates, key=lambda account: account.current_weight)
+            best.current_weight -= total
+            return best
+
+    def disable(self, account, reason):
+        """
+        将账户移出轮换；如果它是最后一个可用账户则保留
+        返回True表示已移出，调用方应把任务交给其他账户
+        """
+        with self._lock:
+            if not account.active:
+                return True
+            if sum(1 for a in self.accounts if a.active) <= 1:
+                return False
+            account.active = False
+            account.disabled_reason = reason
+            return True
+
+    def disabled_summary(self):
+        """已停用账户及原因，用于发送结束后的提示"""
+        return [
+            f"{account.sender.sender_email}: {account.disabled_reason}"
+            for account in self.accounts if account.disabled_reason
+        ]
+
+    def tls_summary(self):
+        """各账户的TLS握手次数和耗时"""
+        return [
+            f"{account.sender.sender_email}: {account.sender.tls_stats.summary()}"
+            for account in self.accounts if account.sender.tls_stats.handshakes
+        ]
@@ -0,0 +1,426 @@
+import asyncio
+import base64
+import re
+import smtplib
+import time
+from email_processor import EmailSender, SendError, recipient_list, to_send_error
+from accounts import is_quota_error
+from message_factory import check_parts, iter_chunks
+
+
+class _AsyncSMTPConnection:
+    """基于asyncio流的最小SMTP客户端，一个实例对应一条已登录的连接"""
+
+    def __init__(self, sender, timeout):
+        self.sender = sender
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.features = {}
+
+    async def connect(self):
+        """建立连接、加密并登录"""
+        sender = self.sender
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(sender.smtp_server, sender.smtp_port),
+            self.timeout
+        )
+        if sender.use_ssl:
+            # SSL端口在TCP连接建立后立即握手
+            await self._start_tls()
+
+        await self._expect((220,))
+        await self.ehlo()
+        if not sender.use_ssl and sender.starttls:
+            await self.command('STARTTLS', (220,))
+            await self._start_tls()
+            await self.ehlo()
+        await self.login()
+        # 登录后会话票据已到达，保存下来供之后的连接复用
+        sender.ssl_context.remember(self.writer.get_extra_info('ssl_object'))
+
+    async def _start_tls(self):
+        """使用发送器缓存的SSL上下文握手，并记录握手耗时"""
+        context = self.sender.ssl_context
+        start = time.perf_counter()
+        await asyncio.wait_for(
+            self.writer.start_tls(context, server_hostname=self.sender.smtp_server),
+            self.timeout
+        )
+        ssl_object = self.writer.get_extra_info('ssl_object')
+        context.stats.record(time.perf_counter() - start, ssl_object.session_reused)
+
+    async def ehlo(self):
+        """发送EHLO并记录服务器支持的扩展"""
+        _, message = await self.command('EHLO localhost', (250,))
+        self.features = {}
+        for line in message.decode('utf-8', 'replace').splitlines()[1:]:
+            name, _, params = line.partition(' ')
+            self.features[name.upper()] = params.upper()
+
+    async def login(self):
+        sender = self.sender
+        if 'PLAIN' in self.features.get('AUTH', '').split():
+            token = f"\0{sender.sender_email}\0{sender.smtp_password}".encode('utf-8')
+            code, message = await self.command(f"AUTH PLAIN {base64.b64encode(token).decode()}")
+        else:
+            code, message = await self.command('AUTH LOGIN', (334,))
+            code, message = await self.command(base64.b64encode(sender.sender_email.encode('utf-8')).decode(), (334,))
+            code, message = await self.command(base64.b64encode(sender.smtp_password.encode('utf-8')).decode())
+        if code != 235:
+            raise smtplib.SMTPAuthenticationError(code, message)
+
+    async def sendmail(self, from_addr, to_addrs, message):
+        """
+        在当前连接上完成一次邮件事务
+        message: 邮件字节串，或MessageFactory.build_parts生成的字节串列表（逐段写入，不再拼接）
+        """
+        if isinstance(message, list):
+            # 附件文件有问题时不开始事务，连接保持可用
+            check_parts(message)
+        code, response = await self.command(f"MAIL FROM:<{from_addr}>")
+        if code != 250:
+            await self._reset()
+            raise smtplib.SMTPSenderRefused(code, response, from_addr)
+
+        refused = {}
+        for addr in to_addrs:
+            code, response = await self.command(f"RCPT TO:<{addr}>")
+            if code not in (250, 251):
+                refused[addr] = (code, response)
+        if len(refused) == len(to_addrs):
+            await self._reset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        await self.command('DATA', (354,))
+        try:
+            if isinstance(message, list):
+                # 写缓冲区满时等待发送，大附件不会在缓冲区中积压；流式附件逐块读取
+                for part in iter_chunks(message):
+                    self.writer.write(part)
+                    await self.writer.drain()
+                self.writer.write(b'.\r\n')
+            else:
+                self.writer.write(_encode_data(message))
+            await self.writer.drain()
+            code, response = await self._read_reply()
+        except Exception:
+            # DATA已经开始，连接处于未知状态，不能再复用
+            self.close()
+            raise
+        if code != 250:
+            await self._reset()
+            raise smtplib.SMTPDataError(code, response)
+        return refused
+
+    async def rset(self):
+        await self.command('RSET', (250,))
+
+    async def _reset(self):
+        """事务失败后重置状态；连接已断开时忽略，以免掩盖服务器原来的错误回复"""
+        try:
+            await self.rset()
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    async def quit(self):
+        """发送QUIT并关闭连接，忽略连接已断开等错误"""
+        if self.writer is None:
+            return
+        try:
+            await self.command('QUIT')
+        except Exception:
+            pass
+        self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def command(self, line, expected=None):
+        """发送一条命令并读取回复；指定expected时回复码不符则抛出异常"""
+        if '\r' in line or '\n' in line:
+            # 与smtplib相同，防止收件人地址等参数中的换行注入其他SMTP命令
+            raise ValueError('SMTP命令及参数中不能包含换行符')
+        if self.writer is None:
+            raise smtplib.SMTPServerDisconnected('连接未建立')
+        self.writer.write(line.encode('utf-8') + b'\r\n')
+        await self.writer.drain()
+        return await self._expect(expected)
+
+    async def _expect(self, expected):
+        code, message = await self._read_reply()
+        if expected and code not in expected:
+            raise smtplib.SMTPResponseException(code, message)
+        return code, message
+
+    async def _read_reply(self):
+        """读取一条（可能多行的）SMTP回复"""
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                self.close()
+                raise smtplib.SMTPServerDisconnected(str(e))
+            except (asyncio.TimeoutError, OSError):
+                # 超时后迟到的回复会与下一条命令错位，与smtplib一样关闭连接
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise smtplib.SMTPServerDisconnected('连接已被服务器关闭')
+            try:
+                code = int(line[:3])
+            except ValueError:
+                raise smtplib.SMTPResponseException(-1, line)
+            lines.append(line[4:].strip())
+            if line[3:4] != b'-':
+                return code, b'\n'.join(lines)
+
+
+def _encode_data(message):
+    """统一换行为CRLF，转义行首的点号，并追加DATA结束标记"""
+    data = message.encode('utf-8') if isinstance(message, str) else message
+    data = re.sub(rb'(?:\r\n|\n|\r(?!\n))', b'\r\n', data)
+    data = re.sub(rb'(?m)^\.', b'..', data)
+    if not data.endswith(b'\r\n'):
+        data += b'\r\n'
+    return data + b'.\r\n'
+
+
+class AsyncEmailSender(EmailSender):
+    """
+    基于asyncio的邮件发送引擎
+    send_email/send_test_email与EmailSender同名同参，但为协程；
+    群发时由AsyncSendEngine在一个事件循环中通过多个连接同时发送大量邮件
+    """
+
+    def __init__(self, config_file="config.ini", section="EMAIL"):
+        super().__init__(config_file, section)
+        # 同时保持的SMTP连接数（即同时进行的邮件事务数），账户节中可单独配置
+        self.concurrency = self.config.getint(
+            section, 'async_connections',
+            fallback=self.config.getint('SENDING', 'async_connections', fallback=100)
+        )
+
+    async def _open_connection(self):
+        connection = _AsyncSMTPConnection(self, self.timeout)
+        try:
+            await connection.connect()
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    async def send_email(self, to_email, subject, html_content, text_content=None, encoded=None,
+                         attachments=()):
+        """发送单封HTML邮件（单独建立连接）"""
+        try:
+            message = self.build_parts(to_email, subject, html_content, text_content, encoded,
+                                       attachments)
+            connection = await self._open_connection()
+            try:
+                return await connection.sendmail(self.sender_email, recipient_list(to_email), message)
+            finally:
+                await connection.quit()
+
+        except Exception as e:
+            raise to_send_error(e)
+
+    async def send_test_email(self):
+        """发送测试邮件，返回(是否成功, 提示信息)"""
+        try:
+            connection = await self._open_connection()
+            try:
+                await connection.sendmail(self.sender_email, [self.sender_email], self.build_test_message())
+                return True, "测试邮件发送成功！"
+            finally:
+                await connection.quit()
+
+        except smtplib.SMTPAuthenticationError:
+            return False, "认证失败：请检查邮箱账号和授权码是否正确"
+        except smtplib.SMTPException as e:
+            return False, f"SMTP错误：{str(e)}"
+        except Exception as e:
+            return False, f"发送失败：{str(e)}"
+
+
+class AsyncSendEngine:
+    """
+    asyncio发送引擎：在一个事件循环中为每个发件账户打开多个连接并发发送
+    账户轮换、重试和限速规则与SMTPConnectionPool一致
+    """
+
+    def __init__(self, rotation):
+        self.rotation = rotation
+
+    async def send_all(self, send_queue, on_sent=None, rate_limiter=None, should_continue=None):
+        """参数含义与SMTPConnectionPool.send_all一致"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        # 工作协程取走任务后置位，唤醒等待队列空位的生产者
+        space = asyncio.Event()
+        state = {'error': None}
+        # 每个账户一个有界队列，最多同时打开concurrency个连接
+        queues = {
+            account.name: asyncio.Queue(maxsize=max(1, account.sender.concurrency) * 2)
+            for account in self.rotation.accounts
+        }
+
+        def stopped():
+            if should_continue is not None and not should_continue():
+                stop.set()
+            return stop.is_set()
+
+        async def wait(seconds):
+            """等待指定秒数，期间被停止则提前返回False"""
+            deadline = loop.time() + seconds
+            while not stopped():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return True
+                await asyncio.sleep(min(remaining, 0.5))
+            return False
+
+        def abort(error):
+            if state['error'] is None:
+                state['error'] = error
+            stop.set()
+
+        async def worker(account, jobs):
+            sender = account.sender
+            connection = None
+            # 连续连接失败的次数，用于本连接的退避等待
+            connect_failures = 0
+            try:
+                while True:
+                    job = await jobs.get()
+                    space.set()
+                    if job is None:
+                        break
+                    # 出错或被停止后只消费队列，保证生产者不会阻塞
+                    if stopped():
+                        continue
+                    # 账户已退出轮换，任务交还给其他账户
+                    if not account.active:
+                        send_queue.requeue(job)
+                        continue
+
+                    if connection is not None:
+                        # 清理上一封邮件的事务状态，同时检测连接是否存活；失败时重新连接
+                        try:
+                            await connection.rset()
+                        except Exception:
+                            connection.close()
+                            connection = None
+                    if connection is None:
+                        try:
+                            connection = await sender._open_connection()
+                        except Exception as e:
+                            error = to_send_error(e)
+                            if error.fatal:
+                                # 认证失败：账户退出轮换，没有其他可用账户时整个任务无法继续
+                                if self.rotation.disable(account, str(error)):
+                                    send_queue.requeue(job)
+                                else:
+                                    send_queue.failed(job, error)
+                                    abort(error)
+                                continue
+                            # 服务器暂时拒绝连接（如421连接数过多）、超时或连接中断：
+                            # 任务按退避时间重试，本连接等待一段时间后再连接，其余连接继续发送
+                            if send_queue.failed(job, error):
+                                abort(error)
+                                continue
+                            connect_failures += 1
+                            await wait(send_queue.backoff(connect_failures))
+                            continue
+                        connect_failures = 0
+
+                    recipients = len(job.recipients)
+                    delay = account.rate_limiter.reserve(recipients)
+                    if rate_limiter:
+                        delay = max(delay, rate_limiter.reserve(recipients))
+                    if not await wait(delay):
+                        continue
+
+                    send_queue.report.mark_attempt(job.rows)
+                    try:
+                        data = sender.build_parts(job.recipients, job.subject, job.html_content,
+                                                  job.text_content, job.encoded, job.attachments)
+                        try:
+                            refused = await connection.sendmail(sender.sender_email, job.recipients, data)
+                        except smtplib.SMTPServerDisconnected:
+                            # 连接被服务器关闭时重连并重试一次
+                            connection.close()
+                            connection = await sender._open_connection()
+                            refused = await connection.sendmail(sender.sender_email, job.recipients, data)
+                    except Exception as e:
+                        error = to_send_error(e)
+                        if connection.writer is None:
+                            # 连接已断开，下一封邮件重新连接
+                            connection = None
+                        if error.fatal or is_quota_error(error):
+                            if self.rotation.disable(account, str(error)):
+                                send_queue.requeue(job)
+                                continue
+                            # 最后一个可用账户的额度也已用完：后续邮件同样会被拒绝，
+                            # 终止整个任务，剩余的行保持未发送，而不是逐行记为失败
+                            error = SendError(str(error), error.code, fatal=True)
+                        if send_queue.failed(job, error):
+                            abort(error)
+                            continue
+                    else:
+                        send_queue.succeeded(job, refused)
+
+                    if on_sent:
+                        on_sent(send_queue.report.completed)
+            finally:
+                if connection is not None:
+                    await connection.quit()
+
+        workers = [
+            asyncio.ensure_future(worker(account, queues[account.name]))
+            for account in self.rotation.accounts
+            for _ in range(max(1, account.sender.concurrency))
+        ]
+        try:
+            job = None
+            while not stopped():
+                if job is None:
+                    # 取任务可能要等待上游流水线生成邮件，放到线程池中执行以免阻塞事件循环
+                    job, delay = await loop.run_in_executor(None, send_queue.poll)
+                    if job is None:
+                        if delay is None:
+                            break
+                        # 等待重试任务到期
+                        await asyncio.sleep(min(delay, 0.5))
+                        continue
+
+                # 按权重选择账户，发送队列已满的账户暂时跳过
+                space.clear()
+                account = self.rotation.choose(lambda a: not queues[a.name].full())
+                if account is None:
+                    if not self.rotation.active_accounts:
+                        abort(SendError("所有发件账户均已停用", fatal=True))
+                        break
+                    # 等到有工作协程取走任务再重新选择
+                    try:
+                        await asyncio.wait_for(space.wait(), 0.5)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await queues[account.name].put(job)
+                job = None
+        finally:
+            for account in self.rotation.accounts:
+                for _ in range(max(1, account.sender.concurrency)):
+                    await queues[account.name].put(None)
+            await asyncio.gather(*workers)
+            if stopped():
+                send_queue.abandon()
+
+        if state['error'] is not None:
+            raise state['error']
+        return send_queue.report
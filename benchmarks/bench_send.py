@@ -0,0 +1,251 @@
+"""
+发送性能测试
+
+在本机启动一个SMTP接收端（独立进程，支持明文和STARTTLS），用生成的Word模板和Excel数据
+分别测试EmailSender单连接顺序发送和EmailSenderThread完整发送流程，
+输出每秒发送数、p50/p95/p99延迟和每封邮件的CPU时间（仅统计发送端进程）
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_send
+    python -m benchmarks.bench_send --rows 1000 --mode starttls --engine asyncio
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from docx import Document
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from email_processor import EmailSender
+from word_reader import WordReader
+from excel_reader import ExcelReader
+from template_renderer import CompiledTemplate
+
+
+def make_template(path):
+    """生成带变量的Word模板"""
+    doc = Document()
+    doc.add_paragraph("尊敬的{姓名}：")
+    doc.add_paragraph("您好！感谢{公司}一直以来对我们的支持。")
+    for i in range(10):
+        para = doc.add_paragraph()
+        run = para.add_run(f"第{i + 1}段正文，用于模拟常见通知邮件的篇幅。" * 3)
+        run.bold = i % 3 == 0
+        run.italic = i % 4 == 0
+    doc.add_paragraph("您的账户编号为{编号}，如有疑问请回复本邮件。")
+    doc.add_paragraph("此致")
+    doc.add_paragraph("敬礼")
+    doc.save(path)
+
+
+def make_excel(path, rows):
+    """生成rows行收件人数据"""
+    pd.DataFrame({
+        '姓名': [f"用户{i}" for i in range(rows)],
+        '邮箱': [f"user{i}@example.com" for i in range(rows)],
+        '公司': [f"公司{i % 100}" for i in range(rows)],
+        '编号': [f"NO{i:08d}" for i in range(rows)],
+    }).to_excel(path, index=False)
+
+
+def make_config(path, port, mode, engine, connections, idle_timeout, render_processes=0,
+                render_cache_size=256):
+    """生成指向本地接收端的配置文件，关闭限速和发送日志"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"""[EMAIL]
+sender_name = 压测
+sender_email = bench@example.com
+smtp_server = localhost
+smtp_port = {port}
+smtp_password = secret
+use_ssl = False
+starttls = {mode == 'starttls'}
+idle_timeout = {idle_timeout}
+
+[SENDING]
+engine = {engine}
+pool_size = {connections}
+async_connections = {connections}
+render_processes = {render_processes}
+render_cache_size = {render_cache_size}
+timeout = 30
+
+[RATE_LIMIT]
+profile = none
+
+[RETRY]
+max_retries = 0
+
+[JOURNAL]
+enabled = False
+""")
+
+
+def start_sink(mode):
+    """在子进程中启动接收端，返回(进程, 端口, 证书路径)"""
+    args = [sys.executable, '-m', 'benchmarks.smtp_sink']
+    if mode == 'starttls':
+        args.append('--tls')
+    process = subprocess.Popen(args, cwd=ROOT, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, text=True)
+    port, _, cert_file = process.stdout.readline().strip().partition(' ')
+    if not port:
+        process.kill()
+        raise RuntimeError("SMTP接收端启动失败")
+    return process, int(port), cert_file
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(name, count, elapsed, cpu, latencies):
+    lat = [v * 1000 for v in latencies]
+    print(f"  {name:<22} {count:>7} 封  {count / elapsed:>9.1f} 封/秒  "
+          f"p50 {percentile(lat, 50):>8.2f}ms  p95 {percentile(lat, 95):>8.2f}ms  "
+          f"p99 {percentile(lat, 99):>8.2f}ms  CPU {cpu / count * 1000:>6.3f}ms/封")
+
+
+def bench_render(template_content, excel_data):
+    """只测试渲染：逐行填充与按列批量填充（含纯文本版本）整个数据集的耗时"""
+    template = CompiledTemplate(template_content)
+    start = time.perf_counter()
+    for row in excel_data:
+        template.render(row)
+        template.render_text(row)
+    row_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frame = pd.DataFrame(excel_data)
+    for _ in zip(template.render_frame(frame), template.text_template.render_frame(frame)):
+        pass
+    frame_time = time.perf_counter() - start
+    print(f"  预渲染 {len(excel_data)} 封：逐行 {row_time:.2f}秒，按列批量 {frame_time:.2f}秒")
+
+
+def bench_sender(config_file, template_content, excel_data):
+    """单连接顺序发送：每封邮件的延迟为一次send_email调用的耗时"""
+    sender = EmailSender(config_file)
+    template = CompiledTemplate(template_content)
+    latencies = []
+    start, cpu_start = time.perf_counter(), time.process_time()
+    with sender:
+        for row in excel_data:
+            content = template.render(row)
+            text = template.render_text(row)
+            t = time.perf_counter()
+            sender.send_email(row['邮箱'], "压测邮件", content, text)
+            latencies.append(time.perf_counter() - t)
+    report("EmailSender", len(excel_data), time.perf_counter() - start,
+           time.process_time() - cpu_start, latencies)
+    if sender.tls_stats.handshakes:
+        print(f"    {sender.tls_stats.summary()}")
+
+
+def bench_thread(config_file, template_content, excel_file, total):
+    """
+    完整发送流程（从逐块读取Excel开始）：
+    延迟为一行邮件生成到发送成功的耗时，包括在流水线和发送队列中的等待
+    """
+    from ui import EmailSenderThread
+
+    class TimedSenderThread(EmailSenderThread):
+        def __init__(self, *args):
+            super().__init__(*args)
+            self.queued = [0.0] * self.total
+            self.latencies = []
+
+        def _render_rows(self, chunks):
+            for job in super()._render_rows(chunks):
+                self.queued[job.rows[0]] = time.perf_counter()
+                yield job
+
+        def _record_journal(self, rows, status, error):
+            now = time.perf_counter()
+            self.latencies.extend(now - self.queued[row] for row in rows)
+            super()._record_journal(rows, status, error)
+
+    errors = []
+    thread = TimedSenderThread(EmailSender(config_file), excel_file, total, template_content,
+                               "压测邮件", '姓名', '邮箱', 0)
+    thread.error_occurred.connect(errors.append)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    # 直接在当前线程中运行，不需要Qt事件循环
+    thread.run()
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    if errors:
+        raise RuntimeError(errors[0])
+    sent = thread.report.summary()['已发送']
+    report(f"EmailSenderThread", sent, elapsed, cpu, thread.latencies)
+    for line in thread.rotation.tls_summary():
+        print(f"    {line}")
+    if thread.render_cache is not None:
+        print(f"    {thread.render_cache.summary()}")
+    if sent != total:
+        print(f"  警告: {total - sent} 封邮件未发送成功")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="邮件发送性能测试")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="测试的数据行数，可指定多个")
+    parser.add_argument('--mode', choices=['plain', 'starttls'], nargs='+',
+                        default=['plain', 'starttls'], help="连接方式")
+    parser.add_argument('--engine', choices=['thread', 'asyncio'], default='thread',
+                        help="EmailSenderThread使用的发送引擎")
+    parser.add_argument('--connections', type=int, default=4, help="并发连接数")
+    parser.add_argument('--idle-timeout', type=int, default=60,
+                        help="连接空闲超时秒数，设为0时每封邮件前都重连，用于测试TLS会话复用")
+    parser.add_argument('--render-processes', type=int, default=0,
+                        help="EmailSenderThread填充模板和编码正文使用的进程数，0表示不使用多进程")
+    parser.add_argument('--render-cache-size', type=int, default=256,
+                        help="渲染缓存大小，0表示不使用缓存")
+    parser.add_argument('--skip-sender', action='store_true', help="不测试EmailSender顺序发送")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_send_') as workdir:
+        template_file = os.path.join(workdir, 'template.docx')
+        make_template(template_file)
+        template_content, _ = WordReader().read_template(template_file)
+
+        for rows in args.rows:
+            excel_file = os.path.join(workdir, f'data_{rows}.xlsx')
+            make_excel(excel_file, rows)
+            t = time.perf_counter()
+            excel_data, _ = ExcelReader().read_data(excel_file)
+            print(f"\n{rows} 行（读取Excel {time.perf_counter() - t:.2f}秒）")
+            bench_render(template_content, excel_data)
+
+            for mode in args.mode:
+                process, port, cert_file = start_sink(mode)
+                if cert_file:
+                    # 两种引擎都验证服务器证书，信任接收端的自签名证书
+                    os.environ['SSL_CERT_FILE'] = cert_file
+                try:
+                    config_file = os.path.join(workdir, f'config_{mode}.ini')
+                    make_config(config_file, port, mode, args.engine, args.connections,
+                                args.idle_timeout, args.render_processes, args.render_cache_size)
+                    print(f" [{mode}, {args.engine}引擎, {args.connections}个连接，"
+                          f"{args.render_processes}个渲染进程]")
+                    if not args.skip_sender:
+                        bench_sender(config_file, template_content, excel_data)
+                    bench_thread(config_file, template_content, excel_file, len(excel_data))
+                finally:
+                    process.stdin.close()
+                    process.wait(timeout=10)
+                    os.environ.pop('SSL_CERT_FILE', None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+渲染缓存正确性检查
+
+用多种写法的模板分别在使用和不使用渲染缓存时填充同一份数据，逐行比较结果；
+缓存键漏掉模板实际用到的数据时，不同收件人会收到相同的内容
+
+用法（在项目根目录执行）：
+    python -m benchmarks.check_render_cache
+"""
+import os
+import sys
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from template_renderer import compile_template
+from render_pool import RenderCache, render_chunk
+
+
+# (模板类型, 模板)
+TEMPLATES = [
+    ('simple', "您好 {姓名}，金额 {金额}"),
+    ('jinja2', "您好 {{ 姓名 }}，金额 {{ row['金额'] }}"),
+    # 以下写法使用整行数据，缓存键须包含所有列
+    ('jinja2', "您好 {{ row.姓名 }}"),
+    ('jinja2', "{% for key, value in row.items() %}{{ key }}={{ value }};{% endfor %}"),
+    ('jinja2', "{{ row.get('邮箱') }}"),
+    ('jinja2', "{% for key in row %}{{ key }}{% endfor %}{{ 姓名 }}"),
+]
+
+
+def make_frame():
+    """取值有重复的数据，并包含相等但填充结果不同的值（1、1.0、True）"""
+    return pd.DataFrame({
+        '姓名': ['张三', '李四', '张三', '王五'],
+        '邮箱': ['a@example.com', 'b@example.com', 'c@example.com', 'a@example.com'],
+        '金额': pd.Series([1, 1.0, True, None], dtype=object),
+    })
+
+
+def main():
+    frame = make_frame()
+    failed = 0
+    for engine, source in TEMPLATES:
+        template = compile_template(source, engine=engine)
+        cache = RenderCache()
+        cached = [result[1] for result in render_chunk(template, frame, cache=cache)]
+        expected = [result[1] for result in render_chunk(template, frame)]
+        ok = cached == expected
+        failed += not ok
+        print(f"  {'通过' if ok else '失败'}  [{engine}] {source}")
+        if not ok:
+            for row, (got, want) in enumerate(zip(cached, expected)):
+                if got != want:
+                    print(f"      第{row + 1}行：缓存 {got!r}，应为 {want!r}")
+    if failed:
+        print(f"{failed} 个模板的缓存结果与直接填充不一致")
+        sys.exit(1)
+    print("渲染缓存结果与直接填充一致")
+
+
+if __name__ == '__main__':
+    main()
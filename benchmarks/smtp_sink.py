@@ -0,0 +1,180 @@
+import os
+import shutil
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+
+
+def create_self_signed_cert(directory):
+    """用openssl生成localhost的自签名证书，返回(证书路径, 私钥路径)"""
+    if shutil.which('openssl') is None:
+        raise RuntimeError("未找到openssl命令，无法生成STARTTLS测试证书")
+    cert_file = os.path.join(directory, 'sink_cert.pem')
+    key_file = os.path.join(directory, 'sink_key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+         '-keyout', key_file, '-out', cert_file, '-days', '1',
+         '-subj', '/CN=localhost',
+         '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1'],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return cert_file, key_file
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """一个SMTP会话：接受任意账号登录和任意收件人，丢弃邮件内容只做计数"""
+
+    def setup(self):
+        super().setup()
+        self.tls = False
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        self.reply('220 localhost ESMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().decode('utf-8', 'replace')
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                features = ['250-localhost', '250-8BITMIME', '250-AUTH PLAIN LOGIN']
+                if sink.tls_context is not None and not self.tls:
+                    features.append('250-STARTTLS')
+                features.append('250 HELP')
+                for feature in features:
+                    self.wfile.write(feature.encode('ascii') + b'\r\n')
+                self.wfile.flush()
+            elif verb == 'STARTTLS' and sink.tls_context is not None and not self.tls:
+                self.reply('220 Ready to start TLS')
+                try:
+                    self.request = sink.tls_context.wrap_socket(self.request, server_side=True)
+                except (ssl.SSLError, OSError):
+                    # 客户端不信任证书等握手失败，直接结束会话
+                    return
+                self.rfile = self.request.makefile('rb')
+                self.wfile = self.request.makefile('wb')
+                self.tls = True
+                with sink.lock:
+                    sink.tls_handshakes += 1
+            elif verb == 'AUTH':
+                parts = command.split()
+                if len(parts) == 2 and parts[1].upper() == 'LOGIN':
+                    # 依次索要用户名和密码
+                    self.reply('334 VXNlcm5hbWU6')
+                    self.rfile.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                elif len(parts) == 2:
+                    self.reply('334 ')
+                    self.rfile.readline()
+                self.reply('235 Authentication successful')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                if verb == 'RCPT':
+                    with sink.lock:
+                        sink.recipients += 1
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b'.\r\n':
+                        break
+                    size += len(data)
+                with sink.lock:
+                    sink.messages += 1
+                    sink.bytes_received += size
+                self.reply('250 OK queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+
+class SMTPSink:
+    """
+    在本机后台线程中运行的SMTP接收端，用于测试发送性能
+    tls=True时支持STARTTLS（自签名证书，证书路径见cert_file）
+    """
+
+    def __init__(self, tls=False, host='127.0.0.1', port=0):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.tls_handshakes = 0
+        self.messages = 0
+        self.recipients = 0
+        self.bytes_received = 0
+        self.tls_context = None
+        self.cert_file = None
+        self._tempdir = None
+        if tls:
+            self._tempdir = tempfile.mkdtemp(prefix='smtp_sink_')
+            self.cert_file, key_file = create_self_signed_cert(self._tempdir)
+            self.tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.tls_context.load_cert_chain(self.cert_file, key_file)
+        self._server = _ThreadingServer((host, port), _SinkHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._tempdir is not None:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    """
+    作为独立进程运行：python -m benchmarks.smtp_sink [--tls]
+    启动后在标准输出打印一行"端口 证书路径"，便于压测脚本单独统计发送端的CPU时间
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="本地SMTP接收端")
+    parser.add_argument('--tls', action='store_true', help="支持STARTTLS")
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args()
+
+    sink = SMTPSink(tls=args.tls, port=args.port).start()
+    print(sink.port, sink.cert_file or '', flush=True)
+    try:
+        # 父进程关闭标准输入时退出
+        sys.stdin.read()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.stop()
+
+
+if __name__ == '__main__':
+    main()
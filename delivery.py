@@ -0,0 +1,274 @@
+import csv
+import heapq
+import random
+import threading
+import time
+from email_processor import SendError
+
+
+# 每行数据的发送状态
+STATUS_PENDING = '未发送'
+STATUS_SENT = '已发送'
+STATUS_RETRYING = '等待重试'
+STATUS_FAILED = '发送失败'
+STATUS_SKIPPED = '此前已发送'
+
+# 已有最终结果的状态
+FINAL_STATUSES = (STATUS_SENT, STATUS_FAILED, STATUS_SKIPPED)
+
+
+def _refused_error(addr, code, message):
+    """单个收件人被拒收时的错误，按回复码区分临时和永久错误"""
+    if isinstance(message, bytes):
+        message = message.decode('utf-8', 'replace')
+    return SendError(f"收件人被拒收: {addr} {code} {message}", code, transient=400 <= code < 500)
+
+
+class SendJob:
+    """
+    一次SMTP事务：rows为对应的Excel行号，recipients为与之一一对应的收件人地址
+    text_content为纯文本版本，为None时发送前从HTML中提取
+    encoded为预先编码好的正文（message_factory.encode_bodies的结果），为None时发送前编码
+    attachments为附件（Attachment元组），同一附件在所有任务间共享
+    """
+
+    __slots__ = ('rows', 'recipients', 'subject', 'html_content', 'text_content', 'encoded',
+                 'attachments', 'attempts')
+
+    def __init__(self, rows, recipients, subject, html_content, attempts=0, text_content=None,
+                 encoded=None, attachments=()):
+        self.rows = list(rows)
+        self.recipients = list(recipients)
+        self.subject = subject
+        self.html_content = html_content
+        self.text_content = text_content
+        self.encoded = encoded
+        self.attachments = attachments
+        self.attempts = attempts
+
+    def subset(self, recipients):
+        """只包含指定收件人的新任务，用于部分收件人被拒收后单独重试"""
+        rows = [row for row, addr in zip(self.rows, self.recipients) if addr in recipients]
+        addrs = [addr for addr in self.recipients if addr in recipients]
+        return SendJob(rows, addrs, self.subject, self.html_content, self.attempts,
+                       self.text_content, self.encoded, self.attachments)
+
+
+def batch_identical_messages(jobs, batch_size, max_pending=100):
+    """
+    将主题、内容和附件完全相同的任务合并为一封多收件人邮件
+    jobs: 可迭代的SendJob
+    batch_size: 每封合并邮件的最大收件人数
+    max_pending: 同时缓存的不同内容数量上限，超出时先发出最早的一组
+    """
+    pending = {}
+    for job in jobs:
+        key = (job.subject, job.html_content, job.attachments)
+        merged = pending.get(key)
+        if merged is None:
+            merged = pending[key] = SendJob([], [], job.subject, job.html_content,
+                                            text_content=job.text_content, encoded=job.encoded,
+                                            attachments=job.attachments)
+        merged.rows.extend(job.rows)
+        merged.recipients.extend(job.recipients)
+
+        if len(merged.recipients) >= batch_size:
+            del pending[key]
+            yield merged
+        elif len(pending) > max_pending:
+            # 字典保持插入顺序，第一个即最早的一组
+            oldest_key = next(iter(pending))
+            yield pending.pop(oldest_key)
+
+    yield from pending.values()
+
+
+class DeliveryReport:
+    """
+    逐行记录发送结果，可在多个发送线程间共享
+    listener: 可选，状态变化后调用listener(rows, status, error)，用于写入发送日志
+    """
+
+    def __init__(self, total, listener=None):
+        self._lock = threading.Lock()
+        self.listener = listener
+        self.status = [STATUS_PENDING] * total
+        self.attempts = [0] * total
+        self.errors = [''] * total
+        self.completed = 0
+
+    def _mark(self, rows, status, error=''):
+        changed = []
+        with self._lock:
+            for row in rows:
+                if self.status[row] in FINAL_STATUSES:
+                    continue
+                if status in FINAL_STATUSES:
+                    self.completed += 1
+                self.status[row] = status
+                self.errors[row] = error
+                changed.append(row)
+        if changed and self.listener is not None:
+            self.listener(changed, status, error)
+
+    def mark_attempt(self, rows):
+        with self._lock:
+            for row in rows:
+                self.attempts[row] += 1
+
+    def mark_sent(self, rows):
+        self._mark(rows, STATUS_SENT)
+
+    def mark_retrying(self, rows, error):
+        self._mark(rows, STATUS_RETRYING, error)
+
+    def mark_failed(self, rows, error):
+        self._mark(rows, STATUS_FAILED, error)
+
+    def mark_skipped(self, rows):
+        """断点续发时跳过此前已发送成功的行"""
+        self._mark(rows, STATUS_SKIPPED)
+
+    def summary(self):
+        """各状态的行数"""
+        counts = {STATUS_PENDING: 0, STATUS_SENT: 0, STATUS_RETRYING: 0, STATUS_FAILED: 0, STATUS_SKIPPED: 0}
+        with self._lock:
+            for status in self.status:
+                counts[status] += 1
+        return counts
+
+    def save_csv(self, file_path, recipients):
+        """
+        保存逐行发送报告，使用带BOM的UTF-8以便Excel直接打开
+        recipients: 每行的收件人地址，发送停止前尚未读取的行为空
+        """
+        with open(file_path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['行号', '收件人', '状态', '尝试次数', '错误信息'])
+            for i, recipient in enumerate(recipients):
+                writer.writerow([i + 2, recipient, self.status[i], self.attempts[i], self.errors[i]])
+
+
+class SendQueue:
+    """
+    发送任务队列：依次提供新任务和到期的重试任务
+    临时性错误（4xx、连接中断）按指数退避加随机抖动重新排队，
+    永久性错误（5xx）直接记为失败，不影响其余邮件继续发送
+    """
+
+    def __init__(self, jobs, report, max_retries=3, base_delay=30, max_delay=600):
+        self._jobs = iter(jobs)
+        self._exhausted = False
+        self._retries = []
+        self._counter = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.report = report
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, config, jobs, report):
+        """从config.ini的[RETRY]节读取重试参数"""
+        return cls(
+            jobs,
+            report,
+            max_retries=config.getint('RETRY', 'max_retries', fallback=3),
+            base_delay=config.getfloat('RETRY', 'base_delay', fallback=30),
+            max_delay=config.getfloat('RETRY', 'max_delay', fallback=600)
+        )
+
+    def poll(self):
+        """
+        取下一个要发送的任务
+        返回(job, None)表示立即发送；(None, 秒数)表示暂无任务，稍后再取；
+        (None, None)表示全部任务（包括重试）都已处理完毕
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._retries and self._retries[0][0] <= now:
+                job = heapq.heappop(self._retries)[2]
+                self._in_flight += 1
+                return job, None
+
+            if not self._exhausted:
+                # 渲染下一封邮件时不持有锁
+                self._in_flight += 1
+            in_flight = self._in_flight
+            next_retry = self._retries[0][0] - now if self._retries else None
+
+        if not self._exhausted:
+            try:
+                return next(self._jobs), None
+            except StopIteration:
+                with self._lock:
+                    self._exhausted = True
+                    self._in_flight -= 1
+                return self.poll()
+
+        if in_flight == 0 and next_retry is None:
+            return None, None
+        # 还有任务在发送中，其结果可能产生新的重试
+        return None, next_retry if next_retry is not None else 0.1
+
+    def succeeded(self, job, refused=None):
+        """任务发送完成；refused为服务器拒收的部分收件人"""
+        refused = refused or {}
+        accepted = [row for row, addr in zip(job.rows, job.recipients) if addr not in refused]
+        self.report.mark_sent(accepted)
+        for addr, (code, message) in refused.items():
+            self._handle_error(job.subset({addr}), _refused_error(addr, code, message))
+        self._done()
+
+    def failed(self, job, error):
+        """
+        任务发送失败，根据SMTP回复码决定重试还是记为失败
+        返回True表示错误无法通过重试恢复（如认证失败），应终止整个发送任务
+        """
+        if error.fatal:
+            self._done()
+            return True
+
+        if error.refused:
+            # 按每个收件人各自的回复码分别处理
+            for addr, (code, message) in error.refused.items():
+                self._handle_error(job.subset({addr}), _refused_error(addr, code, message))
+        else:
+            self._handle_error(job, error)
+        self._done()
+        return False
+
+    def requeue(self, job):
+        """任务未实际发送（如所在账户被停用），立即放回队列交给其他连接，不计入重试次数"""
+        with self._lock:
+            self._counter += 1
+            heapq.heappush(self._retries, (time.monotonic(), self._counter, job))
+            self._in_flight -= 1
+
+    def abandon(self):
+        """发送被停止时，将仍在等待重试的任务记为失败"""
+        with self._lock:
+            retries, self._retries = self._retries, []
+        for _, _, job in retries:
+            self.report.mark_failed(job.rows, f"发送已停止，未再重试: {self.report.errors[job.rows[0]]}")
+
+    def backoff(self, attempts):
+        """第attempts次失败后的等待秒数：指数退避，并加入随机抖动避免大量任务同时重试"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _handle_error(self, job, error):
+        job.attempts += 1
+        if error.transient and job.attempts <= self.max_retries:
+            delay = self.backoff(job.attempts)
+            self.report.mark_retrying(job.rows, str(error))
+            with self._lock:
+                self._counter += 1
+                heapq.heappush(self._retries, (time.monotonic() + delay, self._counter, job))
+        else:
+            self.report.mark_failed(job.rows, str(error))
+
+    def _done(self):
+        with self._lock:
+            self._in_flight -= 1
@@ -1,25 +1,204 @@
 import smtplib
+import socket
+import ssl
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.header import Header
 import configparser
 import os
-from email.utils import formataddr
-from bs4 import BeautifulSoup
+import time
+from template_renderer import html_to_text
+from message_factory import (Attachment, AttachmentError, FileAttachment, MessageFactory,
+                             check_parts, iter_chunks, load_attachment)
+from tls_session import ResumableSSLContext, TLSStats
+
+def recipient_list(to_email):
+    """收件人可以是单个地址，也可以是合并发送的地址列表，统一转换为列表"""
+    if isinstance(to_email, (list, tuple)):
+        return list(to_email)
+    return [to_email]
+
+
+def load_attachments(attachments):
+    """附件可以是文件路径、已编码的Attachment或流式读取的FileAttachment，路径统一转换为Attachment；同一文件只编码一次"""
+    return tuple(
+        attachment if isinstance(attachment, (Attachment, FileAttachment)) else load_attachment(attachment)
+        for attachment in attachments or ()
+    )
+
+
+def _reset(server):
+    """事务失败后重置状态；连接已断开时忽略"""
+    try:
+        server.rset()
+    except smtplib.SMTPServerDisconnected:
+        pass
+
+
+# 小于该长度的片段合并后再写入连接，较大的附件内容直接写入
+_WRITE_THRESHOLD = 64 * 1024
+
+
+def _coalesce(parts):
+    """
+    合并相邻的小片段（邮件头、分隔符、正文等），减少系统调用和小包，并追加DATA结束标记
+    流式附件逐块读出后直接写入
+    """
+    pending = []
+    for part in parts:
+        if isinstance(part, bytes) and len(part) < _WRITE_THRESHOLD:
+            pending.append(part)
+            continue
+        if pending:
+            yield b''.join(pending)
+            pending = []
+        if isinstance(part, bytes):
+            yield part
+        else:
+            yield from part
+    pending.append(b'.\r\n')
+    yield b''.join(pending)
+
+
+def sendmail_parts(server, from_addr, to_addrs, parts):
+    """
+    与smtplib.SMTP.sendmail相同，但邮件为MessageFactory.build_parts生成的字节串列表，
+    DATA阶段逐段写入连接，不再拼接成一整封邮件（也不需要转换换行和转义点号），
+    大附件不会因每个收件人复制一份
+    返回被服务器拒收的收件人字典
+    """
+    # 附件文件有问题时不开始事务，连接保持可用
+    check_parts(parts)
+    server.ehlo_or_helo_if_needed()
+    options = []
+    if server.does_esmtp and server.has_extn('size'):
+        options.append(f"size={sum(len(part) for part in parts)}")
+    code, response = server.mail(from_addr, options)
+    if code != 250:
+        _reset(server)
+        raise smtplib.SMTPSenderRefused(code, response, from_addr)
+
+    refused = {}
+    for addr in to_addrs:
+        code, response = server.rcpt(addr)
+        if code not in (250, 251):
+            refused[addr] = (code, response)
+    if len(refused) == len(to_addrs):
+        _reset(server)
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    code, response = server.docmd('DATA')
+    if code != 354:
+        _reset(server)
+        raise smtplib.SMTPDataError(code, response)
+    try:
+        for data in _coalesce(parts):
+            server.send(data)
+        code, response = server.getreply()
+    except Exception:
+        # DATA已经开始，连接处于未知状态，不能再复用
+        server.close()
+        raise
+    if code != 250:
+        _reset(server)
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+
+class SendError(Exception):
+    """
+    邮件发送失败
+    code: SMTP回复码，连接类错误为None
+    refused: 被拒收的收件人 {地址: (回复码, 回复内容)}
+    transient: 是否为临时性错误（4xx、连接中断），可稍后重试
+    fatal: 是否为无法通过重试恢复的错误（如认证失败），应终止整个发送任务
+    """
+    
+    def __init__(self, message, code=None, refused=None, transient=False, fatal=False):
+        super().__init__(message)
+        self.code = code
+        self.refused = refused or {}
+        self.transient = transient
+        self.fatal = fatal
+
+
+def to_send_error(e):
+    """把smtplib及网络异常转换为SendError，保留SMTP回复码用于区分临时和永久错误"""
+    if isinstance(e, SendError):
+        return e
+    if isinstance(e, AttachmentError):
+        # 本地附件文件的问题，重试无法解决，只有该邮件记为失败
+        return SendError(str(e))
+    # 部分异常（如超时）没有描述信息，使用异常类型名代替
+    message = f"发送邮件失败: {str(e) or type(e).__name__}"
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        return SendError(message, e.smtp_code, fatal=True)
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return SendError(message, refused=e.recipients)
+    if isinstance(e, smtplib.SMTPResponseException):
+        return SendError(message, e.smtp_code, transient=400 <= e.smtp_code < 500)
+    if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+        # 连接中断、超时等网络错误（socket.timeout是OSError的子类）
+        return SendError(message, transient=True)
+    return SendError(message)
+
 
 class EmailSender:
     """邮件发送处理类"""
     
-    def __init__(self, config_file="config.ini"):
-        self.config = self._load_config(config_file)
-        self.sender_name = self.config.get('EMAIL', 'sender_name')
-        self.sender_email = self.config.get('EMAIL', 'sender_email')
-        self.smtp_server = self.config.get('EMAIL', 'smtp_server')
-        self.smtp_port = self.config.getint('EMAIL', 'smtp_port')
-        self.smtp_password = self.config.get('EMAIL', 'smtp_password')
-        self.use_ssl = self.config.getboolean('EMAIL', 'use_ssl')
+    def __init__(self, config_file="config.ini", section="EMAIL"):
+        """section: 发件账户所在的配置节，多账户时为[EMAIL:名称]"""
+        self.config_file = config_file
+        self.section = section
+        self.config = self._load_config(config_file, section)
+        self.sender_name = self.config.get(section, 'sender_name')
+        self.sender_email = self.config.get(section, 'sender_email')
+        self.smtp_server = self.config.get(section, 'smtp_server')
+        self.smtp_port = self.config.getint(section, 'smtp_port')
+        self.smtp_password = self.config.get(section, 'smtp_password')
+        self.use_ssl = self.config.getboolean(section, 'use_ssl')
+        # 未使用SSL时是否通过STARTTLS加密，仅内网中转服务器等不支持加密的场景设为False
+        self.starttls = self.config.getboolean(section, 'starttls', fallback=True)
+        # 是否验证服务器证书，仅自签名证书的内网服务器设为False
+        self.verify_cert = self.config.getboolean(section, 'verify_cert', fallback=True)
+        # 会话模式下连接空闲超过该秒数后，下次发送前主动重连
+        self.idle_timeout = self.config.getint(section, 'idle_timeout', fallback=60)
+        # 并发发送使用的SMTP连接数，账户节中未配置时使用[SENDING]中的值
+        self.pool_size = self.config.getint(
+            section, 'pool_size',
+            fallback=self.config.getint('SENDING', 'pool_size', fallback=1)
+        )
+        # 多账户轮换发送时的权重
+        self.weight = self.config.getfloat(section, 'weight', fallback=1)
+        # 网络操作超时秒数，避免服务器无响应时发送线程永久阻塞
+        self.timeout = self.config.getfloat('SENDING', 'timeout', fallback=60)
+        # 发送引擎：thread（连接池+线程）或 asyncio（单事件循环）
+        self.engine = self.config.get('SENDING', 'engine', fallback='thread').strip().lower()
+        # 合并发送：内容相同的邮件在一次事务中发给多个收件人（密送）
+        self.batch_mode = self.config.getboolean('SENDING', 'batch_mode', fallback=False)
+        self.batch_size = self.config.getint('SENDING', 'batch_size', fallback=50)
+        # 填充模板和编码正文使用的进程数，0表示在发送线程内完成
+        self.render_processes = self.config.getint('SENDING', 'render_processes', fallback=0)
+        # 渲染缓存保存的不同邮件内容数，0表示不使用缓存
+        self.render_cache_size = self.config.getint('SENDING', 'render_cache_size', fallback=256)
+        
+        # 会话模式状态
+        self._server = None
+        self._last_used = 0
+        # TLS握手统计，连接池中同一账户的多个发送器共享同一份
+        self.tls_stats = TLSStats()
+        self._ssl_context = None
+        # 最近一个主题的邮件生成器
+        self._message_factory = None
+    
+    @property
+    def ssl_context(self):
+        """本发送器的SSL上下文，首次使用时创建，之后的连接和重连都复用它及其TLS会话"""
+        if self._ssl_context is None:
+            self._ssl_context = ResumableSSLContext(self.tls_stats, self.verify_cert)
+        return self._ssl_context
     
-    def _load_config(self, config_file):
+    def _load_config(self, config_file, section="EMAIL"):
         """加载配置文件"""
         if not os.path.exists(config_file):
             raise FileNotFoundError(f"找不到配置文件: {config_file}")
@@ -29,11 +208,11 @@ class EmailSender:
         
         # 验证必要配置
         required_options = [
-            ('EMAIL', 'sender_name'),
-            ('EMAIL', 'sender_email'),
-            ('EMAIL', 'smtp_server'),
-            ('EMAIL', 'smtp_port'),
-            ('EMAIL', 'smtp_password')
+            (section, 'sender_name'),
+            (section, 'sender_email'),
+            (section, 'smtp_server'),
+            (section, 'smtp_port'),
+            (section, 'smtp_password')
         ]
         
         for section, option in required_options:
@@ -42,73 +221,185 @@ class EmailSender:
                 
         return config
     
-    def send_email(self, to_email, subject, html_content):
-        """修改发送邮件方法以支持HTML格式"""
+    def _connect(self):
+        """连接SMTP服务器并登录，返回已认证的连接"""
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port,
+                                      timeout=self.timeout, context=self.ssl_context)
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+            server.ehlo()
+            if self.starttls:
+                server.starttls(context=self.ssl_context)
+                server.ehlo()
+        
+        try:
+            server.login(self.sender_email, self.smtp_password)
+        except Exception:
+            self._close_server(server)
+            raise
+        # 邮件分段写入，关闭Nagle算法以免最后一段等待对方的延迟确认
+        server.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if isinstance(server.sock, ssl.SSLSocket):
+            # 登录后会话票据已到达，保存下来供重连时复用
+            self.ssl_context.remember(server.sock)
+        return server
+    
+    @staticmethod
+    def _close_server(server):
+        """关闭连接，忽略连接已断开等错误"""
         try:
-            # 创建邮件
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = Header(subject, 'utf-8')
-            msg['From'] = formataddr((self.sender_name, self.sender_email))
-            msg['To'] = to_email
-            
-            # 添加HTML内容
-            html_part = MIMEText(html_content, 'html', 'utf-8')
-            msg.attach(html_part)
-            
-            # 添加纯文本版本（从HTML中提取）
-            soup = BeautifulSoup(html_content, 'html.parser')
-            text_content = soup.get_text()
-            text_part = MIMEText(text_content, 'plain', 'utf-8')
-            msg.attach(text_part)
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+    
+    def open_session(self):
+        """
+        开启会话模式：只建立一次连接并登录，
+        之后的send_email调用都复用该连接，直到close_session
+        """
+        if self._server is None:
+            self._server = self._connect()
+            self._last_used = time.monotonic()
+    
+    def close_session(self):
+        """结束会话模式并断开连接"""
+        if self._server is not None:
+            server, self._server = self._server, None
+            self._close_server(server)
+    
+    @property
+    def in_session(self):
+        return self._server is not None
+    
+    def __enter__(self):
+        self.open_session()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_session()
+    
+    def _reconnect(self):
+        """丢弃当前会话连接并重新连接登录"""
+        if self._server is not None:
+            self._close_server(self._server)
+        self._server = self._connect()
+        self._last_used = time.monotonic()
+    
+    def _send_in_session(self, recipients, parts):
+        """在会话连接上发送一封邮件（build_parts的结果），连接失效时自动重连并重试一次"""
+        # 空闲过久的连接大概率已被服务器关闭，直接重连
+        if time.monotonic() - self._last_used > self.idle_timeout:
+            self._reconnect()
+        else:
+            # 用RSET清理上一封邮件的事务状态，同时检测连接是否存活
+            try:
+                self._server.rset()
+            except smtplib.SMTPServerDisconnected:
+                self._reconnect()
+        
+        try:
+            refused = sendmail_parts(self._server, self.sender_email, recipients, parts)
+        except smtplib.SMTPServerDisconnected:
+            self._reconnect()
+            refused = sendmail_parts(self._server, self.sender_email, recipients, parts)
+        self._last_used = time.monotonic()
+        return refused
+    
+    def message_factory(self, subject):
+        """同一主题的邮件共用一个MessageFactory，邮件头和分隔符只编码一次"""
+        factory = self._message_factory
+        if factory is None or factory.subject != subject:
+            factory = self._message_factory = MessageFactory(self.sender_name, self.sender_email, subject)
+        return factory
+    
+    def build_parts(self, to_email, subject, html_content, text_content=None, encoded=None,
+                    attachments=()):
+        """
+        构建HTML邮件（附带纯文本版本），返回依次拼接即为完整邮件的字节串列表
+        to_email为多个地址时按密送方式合并发送，收件人之间互不可见
+        text_content: 纯文本版本，通常由CompiledTemplate.render_text生成；未提供时从HTML中提取
+        encoded: 可选，message_factory.encode_bodies预先编码好的正文
+        attachments: 可选，附件的文件路径或Attachment列表
+        """
+        if text_content is None and encoded is None:
+            text_content = html_to_text(html_content)
+        return self.message_factory(subject).build_parts(recipient_list(to_email), html_content,
+                                                         text_content, encoded,
+                                                         load_attachments(attachments))
+    
+    def build_message(self, to_email, subject, html_content, text_content=None, encoded=None,
+                      attachments=()):
+        """构建HTML邮件，返回可直接发送的字节串，参数与build_parts相同"""
+        return b''.join(iter_chunks(self.build_parts(to_email, subject, html_content, text_content,
+                                                     encoded, attachments)))
+    
+    def build_test_message(self):
+        """构建测试邮件，发给发件人自己"""
+        # 创建邮件对象
+        msg = MIMEMultipart()
+        msg['Subject'] = Header('邮件发送测试', 'utf-8').encode()
+        
+        # 修改发件人格式处理
+        sender_name = Header(self.sender_name, 'utf-8').encode()
+        msg['From'] = f'{sender_name} <{self.sender_email}>'
+        msg['To'] = self.sender_email
+        
+        # 添加正文
+        msg.attach(MIMEText('这是一封测试邮件，如果您收到这封邮件，说明邮箱配置正确。', 'plain', 'utf-8'))
+        
+        return msg.as_string()
+    
+    def send_email(self, to_email, subject, html_content, text_content=None, encoded=None,
+                   attachments=()):
+        """
+        修改发送邮件方法以支持HTML格式
+        to_email可以是地址列表，此时在一次SMTP事务中发给所有收件人
+        attachments: 可选，附件的文件路径或Attachment列表，每个文件只读取和编码一次
+        返回被服务器拒收的收件人字典
+        """
+        try:
+            parts = self.build_parts(to_email, subject, html_content, text_content, encoded, attachments)
+            recipients = recipient_list(to_email)
             
-            # 连接到SMTP服务器并发送
-            if self.use_ssl:
-                server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
+            # 会话模式下复用已登录的连接，否则每封邮件单独连接
+            if self._server is not None:
+                return self._send_in_session(recipients, parts)
             else:
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-                server.ehlo()
-                server.starttls()
-                server.ehlo()
-            
-            try:
-                server.login(self.sender_email, self.smtp_password)
-                server.sendmail(self.sender_email, [to_email], msg.as_string())
-            finally:
-                server.quit()
+                server = self._connect()
+                try:
+                    return sendmail_parts(server, self.sender_email, recipients, parts)
+                finally:
+                    self._close_server(server)
             
         except Exception as e:
-            raise Exception(f"发送邮件失败: {str(e)}")
+            raise to_send_error(e)
 
     def send_test_email(self):
         """修改测试邮件发送逻辑"""
         try:
-            # 创建邮件对象
-            msg = MIMEMultipart()
-            msg['Subject'] = Header('邮件发送测试', 'utf-8').encode()
-            
-            # 修改发件人格式处理
-            sender_name = Header(self.sender_name, 'utf-8').encode()
-            msg['From'] = f'{sender_name} <{self.sender_email}>'
-            msg['To'] = self.sender_email
-            
-            # 添加正文
-            msg.attach(MIMEText('这是一封测试邮件，如果您收到这封邮件，说明邮箱配置正确。', 'plain', 'utf-8'))
+            message = self.build_test_message()
             
             # 连接服务器并发送
             if self.use_ssl:
                 # SSL模式
-                server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
+                server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port,
+                                          timeout=self.timeout, context=self.ssl_context)
             else:
                 # TLS模式
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+                server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
                 server.ehlo()  # 发送EHLO命令
-                server.starttls()  # 启用TLS加密
-                server.ehlo()  # TLS连接后重新发送EHLO
+                if self.starttls:
+                    server.starttls(context=self.ssl_context)  # 启用TLS加密
+                    server.ehlo()  # TLS连接后重新发送EHLO
             
             try:
                 server.login(self.sender_email, self.smtp_password)
                 # 使用原始的发送方式
-                server.sendmail(self.sender_email, [self.sender_email], msg.as_string())
+                server.sendmail(self.sender_email, [self.sender_email], message)
                 return True, "测试邮件发送成功！"
             finally:
                 server.quit()
@@ -118,4 +409,4 @@ class EmailSender:
         except smtplib.SMTPException as e:
             return False, f"SMTP错误：{str(e)}"
         except Exception as e:
-            return False, f"发送失败：{str(e)}" 
\ No newline at end of file
+            return False, f"发送失败：{str(e)}"
\ No newline at end of file
@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from openpyxl import load_workbook
 
 class ExcelReader:
     """Excel文件读取器"""
@@ -29,4 +30,79 @@ class ExcelReader:
             return data, columns
             
         except Exception as e:
-            raise ValueError(f"读取Excel文件时出错: {str(e)}") 
\ No newline at end of file
+            raise ValueError(f"读取Excel文件时出错: {str(e)}") 
+
+    def iter_chunks(self, file_path, chunk_size=1000):
+        """
+        按块逐步读取Excel数据，每块为一个最多chunk_size行的DataFrame（列为object类型）
+        .xlsx文件以只读模式流式读取，内存占用与表格行数无关；其他格式整体读取后再分块
+        与read_data一样以第一行为列名，并跳过完全为空的行；空单元格为NaN
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"找不到文件: {file_path}")
+        
+        if not file_path.lower().endswith(('.xlsx', '.xlsm')):
+            data, _ = self.read_data(file_path)
+            frame = pd.DataFrame(data, dtype=object)
+            for start in range(0, len(frame), chunk_size):
+                yield frame.iloc[start:start + chunk_size]
+            return
+        
+        try:
+            workbook = load_workbook(file_path, read_only=True, data_only=True)
+        except Exception as e:
+            raise ValueError(f"读取Excel文件时出错: {str(e)}")
+        try:
+            # 与pandas.read_excel一致，读取第一个工作表
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                raise ValueError("Excel文件中没有数据")
+            columns = _column_names(header)
+            
+            chunk = []
+            for values in rows:
+                if all(value is None for value in values):
+                    continue
+                chunk.append([float('nan') if value is None else value for value in values[:len(columns)]])
+                if len(chunk) >= chunk_size:
+                    yield pd.DataFrame(chunk, columns=columns, dtype=object)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=columns, dtype=object)
+        finally:
+            workbook.close()
+    
+    def read_summary(self, file_path, preview_rows=1):
+        """
+        流式扫描整个表格而不保留数据，用于选择文件后检查列名和生成预览
+        返回(列名列表, 前preview_rows行数据, 总行数)
+        """
+        columns = None
+        preview = []
+        total = 0
+        for chunk in self.iter_chunks(file_path):
+            if columns is None:
+                columns = chunk.columns.tolist()
+            if len(preview) < preview_rows:
+                preview.extend(chunk.iloc[:preview_rows - len(preview)].to_dict(orient='records'))
+            total += len(chunk)
+        if not total:
+            raise ValueError("Excel文件中没有数据")
+        return columns, preview, total
+
+
+def _column_names(header):
+    """与pandas.read_excel相同的列名规则：空列名为Unnamed: 序号，重复的列名依次加.1、.2后缀"""
+    columns = []
+    seen = {}
+    for i, name in enumerate(header):
+        if name is None:
+            name = f"Unnamed: {i}"
+        base = name
+        while name in seen:
+            seen[base] += 1
+            name = f"{base}.{seen[base]}"
+        seen[name] = 0
+        columns.append(name)
+    return columns
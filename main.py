@@ -1,9 +1,12 @@
 import sys
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from ui import MainWindow
 import resources_rc  # 导入编译后的资源文件
 
 if __name__ == "__main__":
+    # 打包为exe后，多进程渲染的工作进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,294 @@
+import base64
+import mimetypes
+import mmap
+import os
+import random
+import re
+import sys
+import threading
+from collections import OrderedDict
+from email.header import Header
+from email.utils import encode_rfc2231, formataddr
+
+
+CRLF = b'\r\n'
+
+# 各正文部分固定的头部
+HTML_PART_HEADERS = (
+    b'Content-Type: text/html; charset="utf-8"\r\n'
+    b'MIME-Version: 1.0\r\n'
+    b'Content-Transfer-Encoding: base64\r\n\r\n'
+)
+TEXT_PART_HEADERS = (
+    b'Content-Type: text/plain; charset="utf-8"\r\n'
+    b'MIME-Version: 1.0\r\n'
+    b'Content-Transfer-Encoding: base64\r\n\r\n'
+)
+
+
+def _make_boundary():
+    """与email库相同格式的分隔符；正文均为base64编码，不会出现连续的等号，因此不会与分隔符冲突"""
+    return f"{'=' * 15}{random.randrange(sys.maxsize):019d}=="
+
+
+def _encode_body(content):
+    """UTF-8编码后按每行76个字符进行base64编码，换行为CRLF"""
+    return base64.encodebytes(content.encode('utf-8')).replace(b'\n', CRLF)
+
+
+class Attachment:
+    """
+    编码好的附件：part_headers为该部分的头部，body为base64编码后的内容
+    同一文件只编码一次，所有包含它的邮件引用同一份body，不会按收件人复制
+    """
+
+    __slots__ = ('path', 'filename', 'version', 'part_headers', 'body')
+
+    def __init__(self, path, filename, version, part_headers, body):
+        self.path = path
+        self.filename = filename
+        # (修改时间, 大小)，文件被修改后重新编码
+        self.version = version
+        self.part_headers = part_headers
+        self.body = body
+
+
+# RFC 2231续行时每段参数值的最大长度，使头部每行都不超过78个字符
+_PARAM_SEGMENT = 60
+
+
+def _rfc2231_param(name, value):
+    """
+    按RFC 2231编码的参数，以空格或换行开头：较短时为 name*=utf-8''..，
+    较长时拆分为 name*0*=utf-8''..; name*1*=.. 等多段，每段单独一行，百分号编码的字节不会被拆开
+    """
+    encoded = encode_rfc2231(value, 'utf-8')
+    if len(encoded) <= _PARAM_SEGMENT:
+        return f" {name}*={encoded}"
+    segments = ['']
+    for token in re.findall(r"%[0-9A-Fa-f]{2}|.", encoded):
+        if len(segments[-1]) + len(token) > _PARAM_SEGMENT:
+            segments.append('')
+        segments[-1] += token
+    return ';'.join(f"\r\n {name}*{i}*={segment}" for i, segment in enumerate(segments))
+
+
+def _attachment_headers(filename):
+    """
+    附件部分的头部；中文文件名同时按RFC 2047和RFC 2231编码，兼容新旧邮件客户端
+    较长的文件名折行或分段，换行均为CRLF
+    """
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if filename.isascii():
+        name = f' name="{filename}"'
+        disposition = f' filename="{filename}"'
+    else:
+        # 编码后的文件名从下一行开始，折行后每行不超过78个字符
+        name = f'\r\n name="{Header(filename, "utf-8").encode(linesep=CRLF.decode())}"'
+        disposition = _rfc2231_param('filename', filename)
+    return (
+        f'Content-Type: {content_type};{name}\r\n'
+        'MIME-Version: 1.0\r\n'
+        'Content-Transfer-Encoding: base64\r\n'
+        f'Content-Disposition: attachment;{disposition}\r\n\r\n'
+    ).encode('ascii')
+
+
+# 最近使用的已编码附件，以绝对路径为键；只保留少量，群发任务自己持有其附件的引用，
+# 被移出缓存不影响正在进行的发送，已结束任务的附件不会一直占用内存
+ATTACHMENT_CACHE_SIZE = 8
+_attachments = OrderedDict()
+_attachments_lock = threading.Lock()
+
+
+def load_attachment(path):
+    """
+    读取并编码附件，最近使用的文件只编码一次
+    文件通过mmap映射读取，直接对映射区域进行base64编码，不额外读入一份原始内容
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _attachments_lock:
+        attachment = _attachments.get(path)
+        if attachment is None or attachment.version != version:
+            with open(path, 'rb') as f:
+                if stat.st_size:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        body = base64.encodebytes(data).replace(b'\n', CRLF)
+                else:
+                    body = b''
+            filename = os.path.basename(path)
+            attachment = _attachments[path] = Attachment(
+                path, filename, version, _attachment_headers(filename), body
+            )
+            if len(_attachments) > ATTACHMENT_CACHE_SIZE:
+                _attachments.popitem(last=False)
+        _attachments.move_to_end(path)
+        return attachment
+
+
+class AttachmentError(Exception):
+    """流式附件的文件不存在或无法读取，属于该邮件自身的问题，重试和更换连接都无法解决"""
+
+
+# 流式编码时每次读取的字节数，为57的整数倍，编码后正好是完整的76字符行
+_STREAM_BLOCK = 57 * 1024
+
+
+class StreamedBody:
+    """
+    从磁盘流式读取并编码的附件内容：迭代时逐块读取文件并base64编码，
+    每次只在内存中保留一块，每封邮件的内存占用与附件大小无关；可重复迭代（重试时重新读取）
+    """
+
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = path
+
+    def check(self):
+        """确认文件存在且可读，在开始邮件事务之前调用，否则抛出AttachmentError"""
+        try:
+            with open(self.path, 'rb'):
+                pass
+        except OSError as e:
+            raise AttachmentError(f"附件无法读取: {self.path} ({e.strerror or e})")
+
+    def __len__(self):
+        """编码后的长度，用于SMTP SIZE扩展"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError as e:
+            raise AttachmentError(f"附件无法读取: {self.path} ({e.strerror or e})")
+        lines, rest = divmod(size, 57)
+        length = lines * 78
+        if rest:
+            length += (rest + 2) // 3 * 4 + 2
+        return length
+
+    def __iter__(self):
+        try:
+            f = open(self.path, 'rb')
+        except OSError as e:
+            raise AttachmentError(f"附件无法读取: {self.path} ({e.strerror or e})")
+        with f:
+            while True:
+                try:
+                    block = f.read(_STREAM_BLOCK)
+                except OSError as e:
+                    raise AttachmentError(f"附件读取失败: {self.path} ({e.strerror or e})")
+                if not block:
+                    return
+                yield base64.encodebytes(block).replace(b'\n', CRLF)
+
+
+class FileAttachment:
+    """每个收件人各自的附件（如工资条），发送时从磁盘流式读取，不预先编码，也不缓存"""
+
+    __slots__ = ('path', 'filename', 'part_headers', 'body')
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.filename = os.path.basename(self.path)
+        self.part_headers = _attachment_headers(self.filename)
+        self.body = StreamedBody(self.path)
+
+
+def check_parts(parts):
+    """确认build_parts结果中的流式附件都可以读取，文件缺失时在发送MAIL FROM之前就抛出AttachmentError"""
+    for part in parts:
+        if not isinstance(part, bytes):
+            part.check()
+
+
+def iter_chunks(parts):
+    """依次返回build_parts结果中的各段字节串，流式附件逐块读取"""
+    for part in parts:
+        if isinstance(part, bytes):
+            yield part
+        else:
+            yield from part
+
+
+def encode_bodies(html_content, text_content):
+    """
+    编码HTML和纯文本正文，返回(html, text)两段base64字节串
+    编码结果与发件人和主题无关，可以在选定发件账户之前预先完成
+    """
+    return _encode_body(html_content), _encode_body(text_content)
+
+
+class MessageFactory:
+    """
+    同一发件人、同一主题的一批邮件的生成器
+    创建时一次性编码好邮件头、分隔符和各部分的头部，
+    每封邮件只需编码收件人和正文，直接拼接出可发送的字节串，不再经过email库的生成过程
+    生成的邮件结构与EmailSender原来用MIMEMultipart构建的相同：
+    multipart/alternative，依次为HTML部分和纯文本部分，均为UTF-8和base64编码；
+    带附件时外层为multipart/mixed，依次为上述正文和各个附件
+    生成的内容换行均为CRLF，且没有以点号开头的行，可直接作为SMTP DATA的内容发送
+    """
+
+    def __init__(self, sender_name, sender_email, subject):
+        self.sender_name = sender_name
+        self.sender_email = sender_email
+        self.subject = subject
+        boundary = _make_boundary()
+        # 过长的主题按RFC 2047折行
+        encoded_subject = Header(subject, 'utf-8').encode(linesep='\r\n')
+        headers = (
+            'MIME-Version: 1.0\r\n'
+            f"Subject: {encoded_subject}\r\n"
+            f"From: {formataddr((sender_name, sender_email))}\r\n"
+            'To: '
+        )
+        alternative = f'Content-Type: multipart/alternative; boundary="{boundary}"\r\n'
+        self._head = (alternative + headers).encode('utf-8')
+        delimiter = f'--{boundary}'.encode('ascii')
+        self._html_start = CRLF * 2 + delimiter + CRLF + HTML_PART_HEADERS
+        self._text_start = CRLF + delimiter + CRLF + TEXT_PART_HEADERS
+        self._end = CRLF + delimiter + b'--' + CRLF
+
+        # 带附件的邮件：正文作为multipart/mixed的第一部分
+        mixed_boundary = _make_boundary()
+        self._mixed_head = (
+            f'Content-Type: multipart/mixed; boundary="{mixed_boundary}"\r\n' + headers
+        ).encode('utf-8')
+        mixed_delimiter = f'--{mixed_boundary}'.encode('ascii')
+        self._alternative_start = (
+            CRLF * 2 + mixed_delimiter + CRLF + alternative.encode('ascii') + b'MIME-Version: 1.0'
+        )
+        self._attachment_start = CRLF + mixed_delimiter + CRLF
+        self._mixed_end = CRLF + mixed_delimiter + b'--' + CRLF
+
+    def build_parts(self, recipients, html_content, text_content, encoded=None, attachments=()):
+        """
+        生成一封邮件，返回依次拼接即为完整邮件的字节串列表
+        recipients: 收件人地址列表，多个收件人时按密送方式发送，To头为undisclosed-recipients
+        encoded: 可选，encode_bodies预先编码好的正文，提供时不再编码html_content和text_content
+        attachments: 可选，load_attachment返回的附件或FileAttachment列表；
+                     列表中直接引用各附件已编码的内容，不复制；FileAttachment的内容为StreamedBody，发送时才读取
+        """
+        to = recipients[0] if len(recipients) == 1 else 'undisclosed-recipients:;'
+        html_body, text_body = encoded or encode_bodies(html_content, text_content)
+        body = [
+            self._html_start,
+            html_body,
+            self._text_start,
+            text_body,
+            self._end,
+        ]
+        if not attachments:
+            return [self._head, to.encode('utf-8')] + body
+        parts = [self._mixed_head, to.encode('utf-8'), self._alternative_start] + body
+        for attachment in attachments:
+            parts.extend((self._attachment_start, attachment.part_headers, attachment.body))
+        parts.append(self._mixed_end)
+        return parts
+
+    def build(self, recipients, html_content, text_content, encoded=None, attachments=()):
+        """生成一封邮件的字节串，参数与build_parts相同"""
+        return b''.join(iter_chunks(
+            self.build_parts(recipients, html_content, text_content, encoded, attachments)
+        ))
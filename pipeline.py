@@ -0,0 +1,59 @@
+import queue
+import threading
+
+
+class _Failure:
+    """上游阶段抛出的异常，随数据一起交给下游"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+def buffered(iterable, maxsize):
+    """
+    流水线中的一个阶段：在后台线程中迭代iterable，结果经容量为maxsize的有界队列逐个交给下游
+    下游处理不过来时队列写满，上游线程随之暂停（背压），因此内存占用与数据总量无关；
+    上游抛出的异常在下游取到该位置时重新抛出；下游提前结束迭代时上游线程也随之退出
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+            return
+        finally:
+            # 上游若也是流水线阶段，关闭它以便其后台线程一并退出
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
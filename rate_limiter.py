@@ -0,0 +1,115 @@
+import threading
+import time
+
+
+# 各时间窗口对应的秒数
+WINDOWS = {
+    'per_second': 1,
+    'per_minute': 60,
+    'per_hour': 3600,
+    'per_day': 86400,
+}
+
+# 常见邮箱服务商的发送限制（经验值，个人邮箱的实际额度以服务商为准）
+PROVIDER_PROFILES = {
+    'qq': {'per_second': 1, 'per_minute': 20, 'per_hour': 300, 'per_day': 500},
+    '163': {'per_second': 1, 'per_minute': 10, 'per_hour': 100, 'per_day': 200},
+    'none': {},
+}
+
+# 根据SMTP服务器地址自动选择限速配置
+PROVIDER_SERVERS = {
+    'smtp.qq.com': 'qq',
+    'smtp.exmail.qq.com': 'qq',
+    'smtp.163.com': '163',
+}
+
+
+class TokenBucket:
+    """令牌桶：容量为capacity，每period秒匀速补充capacity个令牌"""
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, count=1):
+        """还需等待多少秒才有count个可用令牌"""
+        if self.tokens >= count:
+            return 0.0
+        return (count - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    多窗口限速器，可被多个发送线程或协程共享
+    每次发送前调用reserve预订一个发送名额，返回需要等待的秒数；
+    名额按预订顺序排队，多个工作线程共享同一份额度
+    """
+
+    def __init__(self, limits=None, interval=0):
+        """
+        limits: {'per_second': n, 'per_minute': n, ...}，值为0或None表示不限制
+        interval: 任意两封邮件之间的最小间隔秒数（可为小数）
+        """
+        self._lock = threading.Lock()
+        # 服务商额度按收件人计数，发送间隔按邮件（SMTP事务）计数
+        self.buckets = []
+        self.interval_bucket = None
+        for window, limit in (limits or {}).items():
+            if window not in WINDOWS:
+                raise ValueError(f"未知的限速窗口: {window}")
+            if limit:
+                self.buckets.append(TokenBucket(limit, WINDOWS[window]))
+        if interval and interval > 0:
+            self.interval_bucket = TokenBucket(1, interval)
+
+    @classmethod
+    def from_config(cls, config, smtp_server='', interval=0, section=None):
+        """
+        从config.ini的[RATE_LIMIT]节创建限速器
+        profile = auto 时根据smtp_server选择服务商配置，单独配置的窗口覆盖profile中的值
+        section: 可选的发件账户节，其中的rate_profile和各窗口配置优先于[RATE_LIMIT]
+        """
+        profile = config.get('RATE_LIMIT', 'profile', fallback='auto')
+        if section:
+            profile = config.get(section, 'rate_profile', fallback=profile)
+        profile = profile.strip().lower()
+        if profile == 'auto':
+            profile = PROVIDER_SERVERS.get(smtp_server.strip().lower(), 'none')
+        if profile not in PROVIDER_PROFILES:
+            raise ValueError(f"未知的限速配置: {profile}")
+
+        limits = dict(PROVIDER_PROFILES[profile])
+        for window in WINDOWS:
+            for override in ('RATE_LIMIT', section):
+                if override and config.has_option(override, window):
+                    limits[window] = config.getint(override, window)
+        return cls(limits, interval)
+
+    def reserve(self, recipients=1):
+        """为一封发给recipients个收件人的邮件预订发送名额，返回需要等待的秒数"""
+        if not self.buckets and self.interval_bucket is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket in self.buckets:
+                bucket.refill(now)
+                # 合并邮件的收件人数可能超过桶容量，最多等到桶满
+                wait = max(wait, bucket.wait_time(min(recipients, bucket.capacity)))
+            if self.interval_bucket is not None:
+                self.interval_bucket.refill(now)
+                wait = max(wait, self.interval_bucket.wait_time())
+
+            # 令牌可以透支为负数，后来者自然排在更靠后的时间
+            for bucket in self.buckets:
+                bucket.tokens -= recipients
+            if self.interval_bucket is not None:
+                self.interval_bucket.tokens -= 1
+            return wait
@@ -0,0 +1,177 @@
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from template_renderer import compile_template
+from message_factory import encode_bodies
+from send_journal import row_key
+
+
+class RenderCache:
+    """
+    渲染结果的LRU缓存：以模板用到的各列取值为键，保存填充后的HTML、纯文本和编码后的正文
+    部门、地区等取值种类很少的变量会使大量行渲染出相同的内容，命中时直接复用已编码的正文，
+    不再重复填充模板、提取纯文本和base64编码
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def row_values(self, template, chunk):
+        """
+        一块数据中每行的缓存键：模板用到的各列的(类型, 取值)组成的元组，空单元格（NaN）的取值为None
+        1、1.0和True相等且哈希值相同，但填充结果分别为"1"、"1.0"和"True"，因此键中包含类型
+        Jinja2模板以row.列名、row.items()等方式使用整行数据时，以所有列为键
+        """
+        if template.uses_whole_row:
+            names = list(chunk.columns)
+        else:
+            names = sorted(name for name in template.variables if name in chunk.columns)
+        columns = [
+            [(type(value), None if value != value else value) for value in chunk[name].tolist()]
+            for name in names
+        ]
+        return list(zip(*columns)) if columns else [()] * len(chunk)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def record(self, hits, misses):
+        """累加其他进程中缓存的命中次数"""
+        self.hits += hits
+        self.misses += misses
+
+    def summary(self):
+        """例如：渲染缓存命中 9990 次，未命中 10 次（命中率 99.9%）"""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f"渲染缓存命中 {self.hits} 次，未命中 {self.misses} 次（命中率 {rate:.1f}%）"
+
+
+def _render_cached(template, chunk, cache):
+    """使用缓存填充一块数据，返回每行的(HTML, 纯文本, 编码后的正文)；块内取值相同的行也只渲染一次"""
+    keys = cache.row_values(template, chunk)
+    entries = {}
+    pending = {}
+    for position, key in enumerate(keys):
+        if key in entries or key in pending:
+            continue
+        entry = cache.get(key)
+        if entry is None:
+            pending[key] = position
+        else:
+            entries[key] = entry
+    if pending:
+        missed = chunk.iloc[list(pending.values())]
+        contents = template.render_frame(missed)
+        texts = template.text_template.render_frame(missed)
+        for key, content, text in zip(pending, contents, texts):
+            entries[key] = (content, text, encode_bodies(content, text))
+            cache.put(key, entries[key])
+    cache.record(len(keys) - len(pending), len(pending))
+    return [entries[key] for key in keys]
+
+
+def render_chunk(template, chunk, encode=False, cache=None):
+    """
+    填充一块数据（DataFrame），返回每行的(行标识, HTML, 纯文本, 编码后的正文)
+    encode为True时同时完成base64编码，此时不再返回纯文本（为None）以减少进程间传输
+    cache: 可选，RenderCache；使用缓存时总是返回编码后的正文
+    """
+    rows = chunk.to_dict(orient='records')
+    if cache is not None:
+        return [
+            (row_key(row), content, None if encode else text, encoded)
+            for row, (content, text, encoded) in zip(rows, _render_cached(template, chunk, cache))
+        ]
+    contents = template.render_frame(chunk)
+    texts = template.text_template.render_frame(chunk)
+    results = []
+    for row, content, text in zip(rows, contents, texts):
+        if encode:
+            results.append((row_key(row), content, None, encode_bodies(content, text)))
+        else:
+            results.append((row_key(row), content, text, None))
+    return results
+
+
+# 工作进程中的模板和渲染缓存，由进程初始化函数设置，模板每个进程只接收一次
+_worker_template = None
+_worker_cache = None
+
+
+def _init_worker(template_content, settings, cache_size, slots):
+    global _worker_template, _worker_cache
+    _worker_template = compile_template(template_content, slots=slots, **settings)
+    # 纯文本版本的模板也只提取一次
+    _worker_template.text_template
+    _worker_cache = RenderCache(cache_size) if cache_size > 0 else None
+
+
+def _render_in_worker(chunk):
+    """返回渲染结果以及本块的缓存命中和未命中次数"""
+    if _worker_cache is None:
+        return render_chunk(_worker_template, chunk, encode=True), 0, 0
+    hits, misses = _worker_cache.hits, _worker_cache.misses
+    results = render_chunk(_worker_template, chunk, encode=True, cache=_worker_cache)
+    return results, _worker_cache.hits - hits, _worker_cache.misses - misses
+
+
+class RenderPool:
+    """
+    多进程渲染：在多个CPU核心上并行填充模板、提取纯文本和编码正文
+    模板在每个工作进程启动时传入一次，之后每个任务只传输一块数据；
+    同时进行的任务数有上限，结果按提交顺序返回
+    """
+
+    def __init__(self, template_content, processes, settings=None, cache=None, slots=None):
+        """
+        settings: compile_template的参数（template_settings的结果），Jinja2模板的字节码缓存在各进程间共用
+        cache: 可选，RenderCache；每个工作进程使用同样大小的缓存，命中次数汇总到cache中
+        slots: 可选，WordReader生成的槽位索引
+        """
+        self.processes = processes
+        self.cache = cache
+        # 统一使用spawn方式启动，避免在Qt等多线程环境中fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(template_content, settings or {}, cache.max_size if cache is not None else 0, slots)
+        )
+
+    def map(self, chunks):
+        """逐块返回(块, render_chunk的结果)"""
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, self._executor.submit(_render_in_worker, chunk)))
+            if len(pending) >= self.processes * 2:
+                yield self._result(*pending.popleft())
+        while pending:
+            yield self._result(*pending.popleft())
+
+    def _result(self, chunk, future):
+        results, hits, misses = future.result()
+        if self.cache is not None:
+            self.cache.record(hits, misses)
+        return chunk, results
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def campaign_id(subject, template_content, email_column):
+    """同一模板、主题和收件人列视为同一次群发任务"""
+    digest = hashlib.sha1()
+    for part in (subject, email_column, template_content):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def row_key(row):
+    """根据行内容生成的行标识，Excel中插入或调整行顺序后仍能对应"""
+    data = json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class SendJournal:
+    """
+    基于SQLite的发送日志，逐行记录发送结果，用于程序中断后断点续发
+    写入先缓存在内存中，累计batch_size条或距上次写入超过flush_interval秒时批量提交
+    """
+
+    def __init__(self, db_path='send_journal.db', batch_size=200, flush_interval=1.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        # 连接会被多个发送线程使用，访问统一由self._lock保护
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS deliveries (
+                campaign TEXT NOT NULL,
+                row_key TEXT NOT NULL,
+                email TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (campaign, row_key)
+            )
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        """从config.ini的[JOURNAL]节创建，未启用时返回None"""
+        if not config.getboolean('JOURNAL', 'enabled', fallback=True):
+            return None
+        return cls(
+            config.get('JOURNAL', 'path', fallback='send_journal.db'),
+            batch_size=config.getint('JOURNAL', 'batch_size', fallback=200),
+            flush_interval=config.getfloat('JOURNAL', 'flush_interval', fallback=1.0)
+        )
+
+    def delivered(self, campaign):
+        """该群发任务中已发送成功的行标识集合"""
+        self.flush()
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT row_key FROM deliveries WHERE campaign = ? AND status = 'sent'",
+                (campaign,)
+            )
+            return {key for (key,) in cursor}
+
+    def record(self, campaign, key, email, status, error=''):
+        """记录一行的发送结果，必要时批量写入磁盘"""
+        with self._lock:
+            self._pending.append((campaign, key, email, status, error, time.time()))
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending:
+            # 已发送的行不会被之后的失败记录覆盖（例如同一地址重复出现）
+            self._conn.executemany("""
+                INSERT INTO deliveries (campaign, row_key, email, status, error, updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (campaign, row_key) DO UPDATE SET
+                    email = excluded.email,
+                    status = excluded.status,
+                    error = excluded.error,
+                    updated = excluded.updated
+                WHERE deliveries.status != 'sent'
+            """, self._pending)
+            self._conn.commit()
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
@@ -0,0 +1,195 @@
+import queue
+import threading
+import time
+from email_processor import EmailSender, SendError, to_send_error
+from accounts import is_quota_error
+
+
+class SMTPConnectionPool:
+    """
+    SMTP连接池：每个发件账户按其pool_size打开固定数量的连接
+    每个连接由一个会话模式的EmailSender持有，并由一个工作线程独占使用
+    """
+
+    def __init__(self, rotation):
+        self.rotation = rotation
+        self.connections = []
+        for account in rotation.accounts:
+            size = max(1, account.sender.pool_size)
+            # 第一个连接复用账户的发送器，其余按同一配置创建
+            senders = [account.sender] + [
+                EmailSender(account.sender.config_file, account.name) for _ in range(size - 1)
+            ]
+            # 每个连接各自缓存SSL上下文和TLS会话，握手统计按账户汇总
+            for sender in senders[1:]:
+                sender.tls_stats = account.sender.tls_stats
+            self.connections.extend((account, sender) for sender in senders)
+        self.size = len(self.connections)
+        self._stop = threading.Event()
+        # 工作线程取走任务后置位，唤醒等待队列空位的生产者
+        self._space = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        self._should_continue = None
+
+    def _stopped(self):
+        if self._should_continue is not None and not self._should_continue():
+            self._stop.set()
+        return self._stop.is_set()
+
+    def send_all(self, send_queue, on_sent=None, rate_limiter=None, should_continue=None):
+        """
+        用连接池并发发送邮件
+        send_queue: SendQueue，提供待发送任务并调度失败重试，结果记录在其report中
+        on_sent: 每处理完一个任务后调用on_sent(已完成的行数)，在工作线程中执行
+        rate_limiter: 所有账户共享的RateLimiter（发送间隔），各账户另有自己的额度限制
+        should_continue: 返回False时停止发送
+        临时性错误会自动重试，单封邮件失败不影响其余邮件；
+        认证失败或额度用尽的账户退出轮换，只有没有可用账户时才停止整个任务并抛出
+        """
+        self._stop.clear()
+        self._error = None
+        self._should_continue = should_continue
+
+        # 每个账户一个有界队列，渲染速度不会远远超前于发送速度
+        queues = {}
+        for account, _ in self.connections:
+            queues.setdefault(account.name, queue.Queue(maxsize=account.sender.pool_size * 2))
+        workers = [
+            threading.Thread(
+                target=self._worker,
+                args=(account, sender, queues[account.name], send_queue, on_sent, rate_limiter),
+                daemon=True
+            )
+            for account, sender in self.connections
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            job = None
+            while not self._stopped():
+                if job is None:
+                    job, delay = send_queue.poll()
+                    if job is None:
+                        if delay is None:
+                            break
+                        # 等待重试任务到期
+                        self._stop.wait(min(delay, 0.5))
+                        continue
+
+                # 按权重选择账户，发送队列已满的账户暂时跳过
+                self._space.clear()
+                account = self.rotation.choose(lambda a: not queues[a.name].full())
+                if account is None:
+                    if not self.rotation.active_accounts:
+                        self._abort(SendError("所有发件账户均已停用", fatal=True))
+                        break
+                    # 等到有工作线程取走任务再重新选择
+                    self._space.wait(0.5)
+                    continue
+                queues[account.name].put(job)
+                job = None
+        finally:
+            # 每个工作线程一个结束标记
+            for account, _ in self.connections:
+                queues[account.name].put(None)
+            for worker in workers:
+                worker.join()
+            if self._stopped():
+                send_queue.abandon()
+
+        if self._error is not None:
+            raise self._error
+        return send_queue.report
+
+    def _wait(self, seconds):
+        """等待指定秒数，期间被停止则提前返回False"""
+        deadline = time.monotonic() + seconds
+        while not self._stopped():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            self._stop.wait(min(remaining, 0.5))
+        return False
+
+    def _abort(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _worker(self, account, sender, jobs, send_queue, on_sent, rate_limiter):
+        """工作线程：在自己的会话连接上依次发送队列中的邮件"""
+        session_ready = False
+        # 连续连接失败的次数，用于本连接的退避等待
+        connect_failures = 0
+        try:
+            while True:
+                job = jobs.get()
+                self._space.set()
+                if job is None:
+                    break
+                # 出错或被停止后只消费队列，保证生产者不会阻塞
+                if self._stopped():
+                    continue
+                # 账户已退出轮换，任务交还给其他账户
+                if not account.active:
+                    send_queue.requeue(job)
+                    continue
+
+                if not session_ready:
+                    try:
+                        sender.open_session()
+                    except Exception as e:
+                        error = to_send_error(e)
+                        if error.fatal:
+                            # 认证失败：账户退出轮换，没有其他可用账户时整个任务无法继续
+                            if self.rotation.disable(account, str(error)):
+                                send_queue.requeue(job)
+                            else:
+                                send_queue.failed(job, error)
+                                self._abort(error)
+                            continue
+                        # 服务器暂时拒绝连接（如421连接数过多）、超时或连接中断：
+                        # 任务按退避时间重试，本连接等待一段时间后再连接，其余连接继续发送
+                        if send_queue.failed(job, error):
+                            self._abort(error)
+                            continue
+                        connect_failures += 1
+                        self._wait(send_queue.backoff(connect_failures))
+                        continue
+                    session_ready = True
+                    connect_failures = 0
+
+                recipients = len(job.recipients)
+                wait = account.rate_limiter.reserve(recipients)
+                if rate_limiter:
+                    wait = max(wait, rate_limiter.reserve(recipients))
+                if not self._wait(wait):
+                    continue
+
+                send_queue.report.mark_attempt(job.rows)
+                try:
+                    refused = sender.send_email(job.recipients, job.subject, job.html_content,
+                                                job.text_content, job.encoded, job.attachments)
+                except SendError as e:
+                    if e.fatal or is_quota_error(e):
+                        if self.rotation.disable(account, str(e)):
+                            send_queue.requeue(job)
+                            continue
+                        # 最后一个可用账户的额度也已用完：后续邮件同样会被拒绝，
+                        # 终止整个任务，剩余的行保持未发送，而不是逐行记为失败
+                        e = SendError(str(e), e.code, fatal=True)
+                    if send_queue.failed(job, e):
+                        self._abort(e)
+                        continue
+                else:
+                    send_queue.succeeded(job, refused)
+
+                # 在锁内回调，保证上报的进度单调递增
+                with self._lock:
+                    if on_sent:
+                        on_sent(send_queue.report.completed)
+        finally:
+            sender.close_session()
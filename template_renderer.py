@@ -0,0 +1,303 @@
+import hashlib
+import html
+import itertools
+import math
+import os
+import re
+from bs4 import BeautifulSoup
+from jinja2 import BaseLoader, Environment, FileSystemBytecodeCache, meta, nodes
+from pandas.api.types import infer_dtype
+
+
+# 模板中的变量占位符，例如{姓名}
+PLACEHOLDER_PATTERN = re.compile(r'\{([^{}]+)\}')
+
+# Jinja2的标签：{{ 表达式 }}、{% 语句 %}、{# 注释 #}
+JINJA_TAG_PATTERN = re.compile(r'\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\}', re.DOTALL)
+# Jinja2模板中仍使用的单花括号变量，例如{姓名}，但不包括{{和{%
+SIMPLE_PLACEHOLDER_PATTERN = re.compile(r'(?<!\{)\{(?![%#])([^{}]+)(?<![%#])\}(?!\})')
+HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+# HTML中的样式表，其中的CSS规则同样使用花括号
+STYLE_BLOCK_PATTERN = re.compile(r'<style\b.*?</style\s*>', re.IGNORECASE | re.DOTALL)
+
+
+def _column_strings(series):
+    """整列转换为字符串列表，与逐个str(值)的结果相同；已全部是字符串的列直接取出"""
+    if infer_dtype(series, skipna=False) == 'string' and not series.hasnans:
+        return series.tolist()
+    return series.map(str).tolist()
+
+
+def html_to_text(html_content):
+    """从HTML中提取纯文本，用作邮件的纯文本版本"""
+    return BeautifulSoup(html_content, 'html.parser').get_text()
+
+
+def _valid_slots(template, slots):
+    """槽位索引与模板一致：按顺序排列、互不重叠，且每个位置都是一个占位符"""
+    position = 0
+    for start, end, _ in slots:
+        if start < position or end > len(template) or template[start] != '{' or template[end - 1] != '}':
+            return False
+        position = end
+    return True
+
+
+def _split_at_slots(template, slots):
+    """按槽位索引拆分模板，结果与PLACEHOLDER_PATTERN.split的格式相同"""
+    segments = []
+    position = 0
+    for start, end, name in slots:
+        segments.append(template[position:start])
+        segments.append(name)
+        position = end
+    segments.append(template[position:])
+    return segments
+
+
+class CompiledTemplate:
+    """
+    预编译的邮件模板：加载模板时把HTML拆分为固定文本片段和变量槽位，
+    之后每一行数据只需填充槽位并拼接一次，不必对整个HTML逐列执行替换
+    slots: 可选，WordReader生成的槽位索引[(起始位置, 结束位置, 变量名)]，提供时直接按位置拆分，
+           不再搜索占位符（样式表中的花括号等也不会被误认为变量）
+    """
+
+    def __init__(self, template, slots=None):
+        self.template = template
+        # 奇数位置是变量名，偶数位置是变量之间的固定文本
+        if slots is not None and _valid_slots(template, slots):
+            self.segments = _split_at_slots(template, slots)
+        else:
+            self.segments = PLACEHOLDER_PATTERN.split(template)
+        self.slots = [(i, self.segments[i]) for i in range(1, len(self.segments), 2)]
+        self.variables = {name for _, name in self.slots}
+        # 填充结果只取决于variables中的列
+        self.uses_whole_row = False
+        self._text_template = None
+
+    @property
+    def text_template(self):
+        """
+        纯文本版本的模板：首次使用时从模板HTML中提取一次纯文本，变量仍保留为槽位，
+        之后每封邮件直接填充，不再逐封解析HTML
+        """
+        if self._text_template is None:
+            self._text_template = CompiledTemplate(html_to_text(self.template))
+        return self._text_template
+
+    def render(self, row, missing=None):
+        """
+        用一行数据填充模板，返回HTML
+        row: {列名: 值}，变量名与列名相同时替换为str(值)
+        missing: 可选，missing(变量名)返回没有对应列的变量的显示文本；
+                 未提供或返回None时保留原占位符
+        """
+        parts = self.segments.copy()
+        for i, name in self.slots:
+            if name in row:
+                parts[i] = str(row[name])
+            else:
+                text = missing(name) if missing is not None else None
+                parts[i] = text if text is not None else f"{{{name}}}"
+        return ''.join(parts)
+
+    def render_text(self, row):
+        """用同一行数据填充纯文本版本"""
+        return self.text_template.render(row)
+
+    def render_frame(self, frame, chunk_size=10000):
+        """
+        按列批量填充整个DataFrame，逐行返回渲染结果的迭代器
+        每个变量列整列转换为字符串，再把固定文本和各列按槽位顺序并列，每行只拼接一次；
+        按chunk_size行分块处理，大批量群发时内存中只保留一块的结果
+        结果与逐行调用render相同
+        """
+        for start in range(0, len(frame), chunk_size):
+            chunk = frame.iloc[start:start + chunk_size]
+            converted = {}
+            columns = []
+            for i, part in enumerate(self.segments):
+                if i % 2 and part in frame.columns:
+                    if part not in converted:
+                        converted[part] = _column_strings(chunk[part])
+                    columns.append(converted[part])
+                else:
+                    # 固定文本和没有对应列的占位符在每一行中都相同
+                    columns.append(itertools.repeat(f"{{{part}}}" if i % 2 else part, len(chunk)))
+            yield from map(''.join, zip(*columns))
+
+
+def _convert_placeholders(content):
+    """
+    原有的{变量}写法转换为{{ row["变量"] }}，列名中含空格等字符时也能使用
+    <style>中的CSS规则不是变量，原样放在{% raw %}中，也不作为Jinja2语法解析
+    """
+    def convert(text):
+        return SIMPLE_PLACEHOLDER_PATTERN.sub(lambda m: '{{ row[%r] }}' % m.group(1), text)
+
+    parts = []
+    position = 0
+    for match in STYLE_BLOCK_PATTERN.finditer(content):
+        parts.append(convert(content[position:match.start()]))
+        parts.append('{% raw %}' + match.group(0) + '{% endraw %}')
+        position = match.end()
+    parts.append(convert(content[position:]))
+    return ''.join(parts)
+
+
+def _clean_tags(content, unescape=html.unescape):
+    """
+    Word中输入的Jinja2标签经过HTML转义，且可能被格式拆分到多个<span>中：
+    去掉标签内的HTML标签并还原转义字符
+    """
+    return JINJA_TAG_PATTERN.sub(
+        lambda m: unescape(HTML_TAG_PATTERN.sub('', m.group(0))), content
+    )
+
+
+def _jinja_value(value):
+    """空单元格（NaN）按None处理"""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _row_usage(node):
+    """
+    模板中通过row访问的列：返回(row["列名"]形式访问的列名集合, 是否以其他方式使用row)
+    row.列名、row.items()、row.get(...)、{% for k in row %}等无法确定用到哪些列，视为使用整行数据
+    """
+    columns = set()
+    whole_row = False
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if (isinstance(node, nodes.Getitem) and isinstance(node.node, nodes.Name) and node.node.name == 'row'
+                and isinstance(node.arg, nodes.Const) and isinstance(node.arg.value, str)):
+            columns.add(node.arg.value)
+            continue
+        if isinstance(node, nodes.Name) and node.name == 'row':
+            whole_row = True
+        stack.extend(node.iter_child_nodes())
+    return columns, whole_row
+
+
+class _SourceLoader(BaseLoader):
+    """以模板源码的哈希值为模板名，使编译结果可以按哈希值缓存到磁盘"""
+
+    def __init__(self):
+        self.sources = {}
+
+    def add(self, source):
+        name = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        self.sources[name] = source
+        return name
+
+    def get_source(self, environment, name):
+        # 模板名即源码哈希，同名模板的内容不会变化
+        return self.sources[name], None, lambda: True
+
+
+# 每个缓存目录共用一个Jinja2环境
+_environments = {}
+
+
+def _jinja_environment(cache_dir):
+    if cache_dir not in _environments:
+        bytecode_cache = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        # 与{变量}模式一致，变量值原样插入，不做HTML转义
+        _environments[cache_dir] = Environment(
+            loader=_SourceLoader(),
+            bytecode_cache=bytecode_cache,
+            autoescape=False,
+            finalize=lambda value: '' if value is None else value
+        )
+    return _environments[cache_dir]
+
+
+class JinjaTemplate:
+    """
+    Jinja2模式的邮件模板，支持条件判断（{% if %}）、循环（{% for %}）等语法
+    每行数据的各列可直接作为变量使用，也可以通过row["列名"]访问；原有的{列名}写法仍然有效
+    模板每次群发只编译一次，编译后的字节码按模板哈希值缓存在cache_dir中，
+    再次打开同一模板时直接加载，不再重新编译
+    接口与CompiledTemplate相同
+    """
+
+    def __init__(self, template, cache_dir=None, is_html=True):
+        self.template = template
+        self.cache_dir = cache_dir
+        self.is_html = is_html
+        environment = _jinja_environment(cache_dir)
+        source = _convert_placeholders(_clean_tags(template) if is_html else template)
+        self._compiled = environment.get_template(environment.loader.add(source))
+        # 直接使用的变量，以及通过row["列名"]访问的列；
+        # 以其他方式使用row时，填充结果可能取决于任意一列（渲染缓存需以整行为键）
+        ast = environment.parse(source)
+        columns, self.uses_whole_row = _row_usage(ast)
+        self.variables = meta.find_undeclared_variables(ast) - {'row'}
+        self.variables.update(columns)
+        self._text_template = None
+
+    @property
+    def text_template(self):
+        """纯文本版本：从模板HTML中提取一次纯文本后编译，Jinja2标签保留在其中"""
+        if self._text_template is None:
+            if self.is_html:
+                # 标签内先去掉HTML标签，提取纯文本时再还原转义字符
+                text = html_to_text(_clean_tags(self.template, unescape=str))
+                self._text_template = JinjaTemplate(text, self.cache_dir, is_html=False)
+            else:
+                self._text_template = self
+        return self._text_template
+
+    def render(self, row, missing=None):
+        """
+        用一行数据填充模板
+        row: {列名: 值}，空单元格按None处理，在条件判断中为假，输出为空
+        missing: 可选，missing(变量名)返回没有对应列的变量的值，用于预览
+        """
+        values = {key: _jinja_value(value) for key, value in row.items()}
+        if missing is not None:
+            for name in self.variables:
+                if name not in values:
+                    text = missing(name)
+                    if text is not None:
+                        values[name] = text
+        return self._compiled.render(values, row=values)
+
+    def render_text(self, row):
+        """用同一行数据填充纯文本版本"""
+        return self.text_template.render(row)
+
+    def render_frame(self, frame, chunk_size=10000):
+        """逐行填充DataFrame中的数据，Jinja2模板无法按列批量拼接"""
+        for row in frame.to_dict(orient='records'):
+            yield self.render(row)
+
+
+def template_settings(config):
+    """从config.ini的[TEMPLATE]节读取模板设置，作为compile_template的参数"""
+    return {
+        'engine': config.get('TEMPLATE', 'engine', fallback='auto').strip().lower(),
+        'cache_dir': config.get('TEMPLATE', 'cache_dir', fallback='template_cache'),
+    }
+
+
+def compile_template(template, engine='auto', cache_dir=None, slots=None):
+    """
+    编译邮件模板
+    engine: simple为{变量}替换；jinja2为Jinja2模板；auto时模板中出现{{或{%则使用Jinja2
+    slots: 可选，WordReader生成的槽位索引，供{变量}模式直接使用
+    """
+    if engine == 'auto':
+        engine = 'jinja2' if JINJA_TAG_PATTERN.search(template) else 'simple'
+    if engine == 'jinja2':
+        return JinjaTemplate(template, cache_dir)
+    if engine != 'simple':
+        raise ValueError(f"未知的模板类型: {engine}")
+    return CompiledTemplate(template, slots)
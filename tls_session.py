@@ -0,0 +1,76 @@
+import ssl
+import threading
+import time
+
+
+class TLSStats:
+    """TLS握手统计：完整握手和会话复用握手的次数与总耗时，可被同一账户的多个连接共享"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+        self.full_time = 0.0
+        self.resumed_time = 0.0
+
+    def record(self, seconds, resumed):
+        with self._lock:
+            if resumed:
+                self.resumed_handshakes += 1
+                self.resumed_time += seconds
+            else:
+                self.full_handshakes += 1
+                self.full_time += seconds
+
+    @property
+    def handshakes(self):
+        return self.full_handshakes + self.resumed_handshakes
+
+    def summary(self):
+        """例如：TLS握手 12 次（完整 2 次，平均 35.1ms；会话复用 10 次，平均 4.2ms）"""
+        with self._lock:
+            full = self.full_time / self.full_handshakes * 1000 if self.full_handshakes else 0
+            resumed = self.resumed_time / self.resumed_handshakes * 1000 if self.resumed_handshakes else 0
+            return (f"TLS握手 {self.full_handshakes + self.resumed_handshakes} 次"
+                    f"（完整 {self.full_handshakes} 次，平均 {full:.1f}ms；"
+                    f"会话复用 {self.resumed_handshakes} 次，平均 {resumed:.1f}ms）")
+
+
+class ResumableSSLContext(ssl.SSLContext):
+    """
+    客户端SSL上下文，每个发送器创建一次并在重连时复用
+    记住最近一次握手得到的TLS会话（会话票据），之后新建的连接自动尝试会话复用，
+    服务器不接受时自动退回完整握手
+    """
+
+    def __init__(self, stats=None, verify=True):
+        # SSLContext在__new__中完成初始化，这里只设置附加属性
+        self.stats = stats if stats is not None else TLSStats()
+        self.session = None
+        if verify:
+            self.load_default_certs(ssl.Purpose.SERVER_AUTH)
+        else:
+            self.check_hostname = False
+            self.verify_mode = ssl.CERT_NONE
+
+    def __new__(cls, stats=None, verify=True):
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def wrap_socket(self, sock, *args, session=None, **kwargs):
+        """smtplib在starttls和SMTP_SSL中调用，握手在此完成，同时记录握手耗时"""
+        start = time.perf_counter()
+        tls_sock = super().wrap_socket(sock, *args, session=session or self.session, **kwargs)
+        self.stats.record(time.perf_counter() - start, tls_sock.session_reused)
+        return tls_sock
+
+    def wrap_bio(self, incoming, outgoing, *args, session=None, **kwargs):
+        """asyncio的TLS连接使用，握手耗时由调用方记录"""
+        return super().wrap_bio(incoming, outgoing, *args, session=session or self.session, **kwargs)
+
+    def remember(self, ssl_object):
+        """
+        保存连接的TLS会话供下次连接复用
+        TLS 1.3的会话票据在握手之后才由服务器发送，应在收到服务器回复（如登录完成）后调用
+        """
+        if ssl_object is not None and ssl_object.session is not None:
+            self.session = ssl_object.session
@@ -1,14 +1,27 @@
 import os
 import sys
+import asyncio
+import itertools
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QPushButton, QLineEdit, QFileDialog, 
-                            QSpinBox, QTextEdit, QProgressBar, QComboBox,
+                            QDoubleSpinBox, QTextEdit, QProgressBar, QComboBox,
                             QGroupBox, QFormLayout, QMessageBox, QDialog,
-                            QListWidget)
+                            QListWidget, QCheckBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
 from PyQt5.QtGui import QFont, QPixmap, QIcon
 from qt_material import apply_stylesheet
-from email_processor import EmailSender
+from email_processor import EmailSender, load_attachments
+from smtp_pool import SMTPConnectionPool
+from async_sender import AsyncEmailSender, AsyncSendEngine
+from accounts import AccountRotation
+from rate_limiter import RateLimiter
+from delivery import (SendJob, SendQueue, DeliveryReport, batch_identical_messages,
+                      STATUS_SENT, STATUS_FAILED, STATUS_RETRYING, STATUS_PENDING, STATUS_SKIPPED)
+from send_journal import SendJournal, campaign_id
+from template_renderer import JinjaTemplate, compile_template, template_settings
+from message_factory import FileAttachment, encode_bodies
+from pipeline import buffered
+from render_pool import RenderCache, RenderPool, render_chunk
 from word_reader import WordReader
 from excel_reader import ExcelReader
 import pandas as pd
@@ -68,54 +81,198 @@ class EmailSenderThread(QThread):
     sending_finished = pyqtSignal()
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, email_sender, excel_data, template_content, subject,
-                 name_column, email_column, interval):
+    # 写入发送日志的状态
+    JOURNAL_STATUS = {STATUS_SENT: 'sent', STATUS_FAILED: 'failed', STATUS_RETRYING: 'retrying'}
+    # 每次从Excel读取的行数
+    CHUNK_SIZE = 1000
+    # 流水线各阶段之间最多缓存的邮件数
+    QUEUE_SIZE = 256
+    
+    def __init__(self, email_sender, excel_file, total, template_content, subject,
+                 name_column, email_column, interval, resume=False, attachments=(),
+                 attachment_column=None, template_slots=None):
+        """
+        excel_file: Excel数据文件，发送时逐块读取，不整体载入内存
+        total: 数据行数（ExcelReader.read_summary的结果）
+        attachments: 所有邮件共用的附件文件路径
+        attachment_column: 可选，该列为每个收件人各自附件的文件路径，相对路径相对于Excel文件所在目录
+        template_slots: 可选，WordReader生成的槽位索引，填充模板时直接使用
+        """
         super().__init__()
         self.email_sender = email_sender
-        self.excel_data = excel_data
+        self.excel_file = excel_file
+        self.total = total
         self.template_content = template_content
+        # 模板每次群发只编译一次
+        self.template_settings = template_settings(email_sender.config)
+        self.template_slots = template_slots
+        self.template = compile_template(template_content, slots=template_slots, **self.template_settings)
+        # 模板用到的各列取值相同的行直接复用渲染和编码结果
+        cache_size = email_sender.render_cache_size
+        self.render_cache = RenderCache(cache_size) if cache_size > 0 else None
         self.subject = subject
         self.name_column = name_column
         self.email_column = email_column
         self.interval = interval
+        self.resume = resume
+        self.attachment_files = list(attachments)
+        # 编码后的附件，开始发送时读取，所有邮件共享同一份
+        self.attachments = ()
+        self.attachment_column = attachment_column
         self.is_running = True
+        # 逐行发送结果，发送结束后由主窗口保存；结果同时写入发送日志
+        self.report = DeliveryReport(total, listener=self._record_journal)
+        self.journal = None
+        # 多账户轮换状态，发送结束后用于提示被停用的账户
+        self.rotation = None
+        self.campaign = campaign_id(subject, template_content, email_column)
+        # 每行的行标识和收件人，在读取到该行时填入，用于发送日志和发送报告
+        self.row_keys = [''] * total
+        self.recipients = [''] * total
+        self.delivered = set()
     
     def run(self):
+        messages = None
         try:
-            total = len(self.excel_data)
-            for i, row in enumerate(self.excel_data):
-                if not self.is_running:
-                    break
-                    
-                # 替换模板中的变量
-                content = self.template_content
-                for col, value in row.items():
-                    content = content.replace(f"{{{col}}}", str(value))
-                
-                # 发送邮件
-                self.email_sender.send_email(
-                    row[self.email_column],
-                    self.subject,
-                    content
-                )
-                
-                # 更新进度
-                progress = int((i + 1) / total * 100)
-                self.progress_updated.emit(progress)
-                
-                # 等待指定时间
-                if i < total - 1:  # 最后一封邮件不需要等待
-                    QThread.sleep(self.interval)
+            self.journal = SendJournal.from_config(self.email_sender.config)
+            if self.resume and self.journal is not None:
+                # 断点续发：跳过此前已发送成功的行
+                self.delivered = self.journal.delivered(self.campaign)
+            
+            # 附件只读取和编码一次
+            self.attachments = load_attachments(self.attachment_files)
             
+            # 发送间隔由所有账户共享的限速器控制，服务商额度由各账户自己的限速器控制
+            rate_limiter = RateLimiter(interval=self.interval)
+            # 失败的邮件按错误类型重试或记为失败，不会中断其余邮件的发送
+            messages = self._render_messages()
+            send_queue = SendQueue.from_config(self.email_sender.config, messages, self.report)
+            
+            if self.email_sender.engine == 'asyncio':
+                # 在本线程中运行事件循环，由一个循环驱动大量并发连接
+                self.rotation = AccountRotation.from_config(self.email_sender.config_file, AsyncEmailSender)
+                asyncio.run(AsyncSendEngine(self.rotation).send_all(
+                    send_queue,
+                    on_sent=self._report_progress,
+                    rate_limiter=rate_limiter,
+                    should_continue=lambda: self.is_running
+                ))
+            else:
+                # 每个连接整个发送过程只登录一次，多个连接并发发送
+                self.rotation = AccountRotation.from_config(self.email_sender.config_file)
+                pool = SMTPConnectionPool(self.rotation)
+                pool.send_all(
+                    send_queue,
+                    on_sent=self._report_progress,
+                    rate_limiter=rate_limiter,
+                    should_continue=lambda: self.is_running
+                )
             self.sending_finished.emit()
             
         except Exception as e:
             self.error_occurred.emit(str(e))
+        finally:
+            if messages is not None:
+                # 中途停止时结束流水线的后台线程
+                messages.close()
+            if self.journal is not None:
+                self.journal.close()
+    
+    def _render_messages(self):
+        """
+        待发送邮件的流水线：读取Excel → 填充模板 → 编码正文，由发送引擎逐个取用
+        各阶段在各自的后台线程中运行，之间用有界队列连接；发送跟不上时上游自动暂停，
+        内存中只保留少量数据块和邮件，与收件人总数无关
+        """
+        chunks = buffered(ExcelReader().iter_chunks(self.excel_file, self.CHUNK_SIZE), 2)
+        messages = buffered(self._render_rows(chunks), self.QUEUE_SIZE)
+        if self.email_sender.batch_mode:
+            # 内容完全相同的邮件合并为一封，按密送方式一次发给多个收件人
+            messages = batch_identical_messages(messages, self.email_sender.batch_size)
+        return buffered(self._encode_messages(messages), self.QUEUE_SIZE)
+    
+    def _rendered_chunks(self, chunks):
+        """
+        逐块填充模板，返回(块, 每行的渲染结果)
+        配置了render_processes时由多个进程并行填充并编码，否则在当前线程中填充
+        """
+        processes = self.email_sender.render_processes
+        if processes <= 0:
+            for chunk in chunks:
+                yield chunk, render_chunk(self.template, chunk, cache=self.render_cache)
+            return
+        with RenderPool(self.template_content, processes, self.template_settings,
+                        self.render_cache, self.template_slots) as pool:
+            yield from pool.map(chunks)
+    
+    def _render_rows(self, chunks):
+        """按块填充模板：每块内按列批量填充变量，纯文本版本使用同一行数据填充"""
+        i = 0
+        for chunk, results in self._rendered_chunks(chunks):
+            if self.attachment_column is not None:
+                files = chunk[self.attachment_column].tolist()
+            else:
+                files = itertools.repeat(None)
+            for email, file, (key, content, text, encoded) in zip(chunk[self.email_column].tolist(), files, results):
+                if i >= self.total:
+                    # 选择文件后表格又被修改，多出的行不发送
+                    return
+                self.row_keys[i] = key
+                self.recipients[i] = email
+                if key in self.delivered:
+                    self.report.mark_skipped([i])
+                else:
+                    attachments, error = self._row_attachments(file)
+                    if error:
+                        self.report.mark_failed([i], error)
+                    else:
+                        yield SendJob([i], [email], self.subject, content, text_content=text,
+                                      encoded=encoded, attachments=attachments)
+                i += 1
+    
+    def _row_attachments(self, file):
+        """
+        一行的附件：共用附件加上个人附件，返回(附件, 错误信息)
+        个人附件在发送时才从磁盘流式读取；单元格为空时只发送共用附件，文件不存在时该行记为失败
+        """
+        if file is None or not isinstance(file, str) or not file.strip():
+            return self.attachments, ''
+        path = os.path.join(os.path.dirname(os.path.abspath(self.excel_file)), file.strip())
+        if not os.path.isfile(path):
+            return self.attachments, f"附件不存在: {file}"
+        return self.attachments + (FileAttachment(path),), ''
+    
+    def _encode_messages(self, messages):
+        """预先编码正文，发送时只需拼接邮件头；已由渲染进程编码的邮件直接交出"""
+        for job in messages:
+            if job.encoded is None:
+                job.encoded = encode_bodies(job.html_content, job.text_content)
+            yield job
+    
+    def _record_journal(self, rows, status, error):
+        """发送结果写入发送日志（在发送工作线程中调用）"""
+        if self.journal is None or status not in self.JOURNAL_STATUS:
+            return
+        for row in rows:
+            self.journal.record(
+                self.campaign,
+                self.row_keys[row],
+                self.recipients[row],
+                self.JOURNAL_STATUS[status],
+                error
+            )
+    
+    def _report_progress(self, completed):
+        """更新进度（在发送工作线程中调用）"""
+        progress = int(completed / self.total * 100)
+        self.progress_updated.emit(progress)
     
     def stop(self):
         self.is_running = False
 
 class MainWindow(QMainWindow):
+    NO_ATTACHMENT_COLUMN = "（不使用）"
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("智能邮件群发系统")
@@ -134,13 +291,25 @@ class MainWindow(QMainWindow):
         self.setObjectName("mainWindow")
         
         # 初始化读取器和发送器
-        self.word_reader = WordReader()
-        self.excel_reader = ExcelReader()
         self.email_sender = EmailSender()
+        # 模板解析结果缓存在模板缓存目录中，再次打开同一模板时无需重新解析
+        config = self.email_sender.config
+        self.word_reader = WordReader(
+            template_settings(config)['cache_dir'],
+            fast=config.getboolean('TEMPLATE', 'fast_reader', fallback=True),
+            style_classes=config.getboolean('TEMPLATE', 'style_classes', fallback=False)
+        )
+        self.excel_reader = ExcelReader()
         
         # 数据存储
         self.template_content = ""
-        self.excel_data = None
+        self.template_slots = None
+        self.compiled_template = None
+        # Excel只保留前几行用于预览，发送时再逐块读取
+        self.excel_file = ""
+        self.excel_preview = []
+        self.excel_total = 0
+        self.attachment_files = []
         self.name_column = ""
         self.email_column = ""
         
@@ -193,8 +362,26 @@ class MainWindow(QMainWindow):
         excel_layout.addWidget(excel_browse_btn)
         excel_layout.setSpacing(10)
         
+        # 附件选择（可选，所有邮件共用）
+        attachment_layout = QHBoxLayout()
+        self.attachment_path = QLineEdit()
+        self.attachment_path.setReadOnly(True)
+        self.attachment_path.setMinimumHeight(32)
+        self.attachment_path.setPlaceholderText("可选，所有邮件共用的附件")
+        attachment_browse_btn = QPushButton("浏览...")
+        attachment_browse_btn.setFixedSize(90, 32)
+        attachment_browse_btn.clicked.connect(self.browse_attachments)
+        attachment_clear_btn = QPushButton("清除")
+        attachment_clear_btn.setFixedSize(90, 32)
+        attachment_clear_btn.clicked.connect(self.clear_attachments)
+        attachment_layout.addWidget(self.attachment_path)
+        attachment_layout.addWidget(attachment_browse_btn)
+        attachment_layout.addWidget(attachment_clear_btn)
+        attachment_layout.setSpacing(10)
+        
         file_layout.addRow("Word模板:", word_layout)
         file_layout.addRow("Excel数据:", excel_layout)
+        file_layout.addRow("附件:", attachment_layout)
         file_group.setLayout(file_layout)
         
         # ===== 邮件配置区域 =====
@@ -212,16 +399,27 @@ class MainWindow(QMainWindow):
         self.subject_input.setMinimumHeight(32)
         
         # 发送间隔设置
-        self.interval_spinbox = QSpinBox()
+        self.interval_spinbox = QDoubleSpinBox()
         self.interval_spinbox.setMinimumHeight(32)
-        self.interval_spinbox.setRange(1, 600)
+        self.interval_spinbox.setDecimals(2)
+        self.interval_spinbox.setRange(0, 600)
         self.interval_spinbox.setValue(30)
         self.interval_spinbox.setSuffix(" 秒")
         
+        # 个人附件列：该列中为每个收件人各自附件的文件路径
+        self.attachment_column_combo = QComboBox()
+        self.attachment_column_combo.setMinimumHeight(32)
+        self.attachment_column_combo.addItem(self.NO_ATTACHMENT_COLUMN)
+        
         # 将组件添加到配置布局
         config_layout.addRow("变量状态:", self.variables_status)
         config_layout.addRow("邮件主题:", self.subject_input)
         config_layout.addRow("发送间隔:", self.interval_spinbox)
+        config_layout.addRow("个人附件列:", self.attachment_column_combo)
+        
+        # 断点续发选项
+        self.resume_checkbox = QCheckBox("断点续发（跳过此前已发送成功的收件人）")
+        config_layout.addRow("", self.resume_checkbox)
         
         # 测试按钮和帮助按钮
         test_btn_layout = QHBoxLayout()
@@ -351,7 +549,7 @@ class MainWindow(QMainWindow):
             QPushButton:disabled {
                 background-color: #bdc3c7;
             }
-            QLineEdit, QTextEdit, QComboBox, QSpinBox {
+            QLineEdit, QTextEdit, QComboBox, QSpinBox, QDoubleSpinBox {
                 background-color: white;
                 border-radius: 4px;
                 border: 1px solid #ced4da;
@@ -360,7 +558,7 @@ class MainWindow(QMainWindow):
                 font-size: 13px;
                 min-height: 32px;
             }
-            QLineEdit:focus, QTextEdit:focus, QComboBox:focus, QSpinBox:focus {
+            QLineEdit:focus, QTextEdit:focus, QComboBox:focus, QSpinBox:focus, QDoubleSpinBox:focus {
                 border: 2px solid #3498db;
                 background-color: white;
             }
@@ -436,16 +634,27 @@ class MainWindow(QMainWindow):
         if file_path:
             self.word_path.setText(file_path)
             try:
-                self.template_content, self.template_variables = self.word_reader.read_template(file_path)
+                self.template_content, self.template_variables, self.template_slots = \
+                    self.word_reader.read_template(file_path, with_slots=True)
+                self.compiled_template = compile_template(
+                    self.template_content, slots=self.template_slots,
+                    **template_settings(self.email_sender.config)
+                )
+                if isinstance(self.compiled_template, JinjaTemplate):
+                    # Jinja2模板中的变量以编译结果为准
+                    self.template_variables = sorted(self.compiled_template.variables)
                 # 显示找到的变量
                 variables_text = "模板中的变量：\n" + "\n".join([f"{{{var}}}" for var in self.template_variables])
                 self.variables_status.setText(variables_text)
                 
                 # 如果已经加载了Excel，检查变量匹配
-                if self.excel_data:
+                if self.excel_total:
                     self.check_variable_matching()
                 
-                QMessageBox.information(self, "成功", f"Word模板加载成功!\n找到 {len(self.template_variables)} 个变量。")
+                message = f"Word模板加载成功!\n找到 {len(self.template_variables)} 个变量。"
+                if self.word_reader.style_classes:
+                    message += f"\n{self.word_reader.style_stats.summary()}"
+                QMessageBox.information(self, "成功", message)
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"无法读取Word文档: {str(e)}")
     
@@ -457,16 +666,45 @@ class MainWindow(QMainWindow):
         if file_path:
             self.excel_path.setText(file_path)
             try:
-                self.excel_data, self.excel_columns = self.excel_reader.read_data(file_path)
+                # 流式扫描表格，只保留列名、预览行和总行数
+                self.excel_columns, self.excel_preview, self.excel_total = \
+                    self.excel_reader.read_summary(file_path)
+                self.excel_file = file_path
+                
+                # 列名包含"附件"的列默认作为个人附件列
+                self.attachment_column_combo.clear()
+                self.attachment_column_combo.addItem(self.NO_ATTACHMENT_COLUMN)
+                self.attachment_column_combo.addItems([str(col) for col in self.excel_columns])
+                for col in self.excel_columns:
+                    if "附件" in str(col) or "attachment" in str(col).lower():
+                        self.attachment_column_combo.setCurrentText(str(col))
+                        break
                 
                 # 如果已经加载了Word模板，检查变量匹配
                 if hasattr(self, 'template_variables'):
                     self.check_variable_matching()
                 
-                QMessageBox.information(self, "成功", f"Excel数据加载成功！共{len(self.excel_data)}条记录。")
+                QMessageBox.information(self, "成功", f"Excel数据加载成功！共{self.excel_total}条记录。")
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"无法读取Excel文件: {str(e)}")
     
+    def browse_attachments(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "选择附件", "", "所有文件 (*)")
+        if file_paths:
+            self.attachment_files = file_paths
+            self.attachment_path.setText("; ".join(os.path.basename(path) for path in file_paths))
+    
+    @property
+    def attachment_column(self):
+        """选择的个人附件列，未选择时为None"""
+        if self.attachment_column_combo.currentIndex() <= 0:
+            return None
+        return self.excel_columns[self.attachment_column_combo.currentIndex() - 1]
+    
+    def clear_attachments(self):
+        self.attachment_files = []
+        self.attachment_path.clear()
+    
     def check_variable_matching(self):
         """检查Word模板变量与Excel列的匹配情况，并自动生成预览"""
         if not hasattr(self, 'template_variables') or not hasattr(self, 'excel_columns'):
@@ -531,7 +769,7 @@ class MainWindow(QMainWindow):
 
     def auto_generate_preview(self, unmatched_vars=None):
         """自动生成预览"""
-        if not self.template_content or not self.excel_data:
+        if not self.template_content or not self.excel_preview:
             return
             
         if not self.name_column or not self.email_column:
@@ -539,16 +777,14 @@ class MainWindow(QMainWindow):
             
         # 获取第一条数据作为预览
         try:
-            first_row = self.excel_data[0]
-            content = self.template_content
+            first_row = self.excel_preview[0]
+            unmatched = set(unmatched_vars or ())
             
-            # 替换所有匹配的变量
-            for var in self.template_variables:
-                if var in first_row:
-                    content = content.replace(f"{{{var}}}", str(first_row[var]))
-                elif var in unmatched_vars:
-                    # 对于未匹配的变量，保留原样显示
-                    content = content.replace(f"{{{var}}}", f"[未匹配变量: {{{var}}}]")
+            # 填充所有匹配的变量，未匹配的变量标注后原样显示
+            content = self.compiled_template.render(
+                first_row,
+                missing=lambda var: f"[未匹配变量: {{{var}}}]" if var in unmatched else None
+            )
             
             # 获取主题（如果未输入，使用默认值）
             subject = self.subject_input.text() or "[请输入邮件主题]"
@@ -575,7 +811,7 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "请先加载Word模板!")
             return
             
-        if not self.excel_data:
+        if not self.excel_total:
             QMessageBox.warning(self, "警告", "请先加载Excel数据!")
             return
             
@@ -591,12 +827,17 @@ class MainWindow(QMainWindow):
         # 创建发送线程
         self.sender_thread = EmailSenderThread(
             self.email_sender,
-            self.excel_data,
+            self.excel_file,
+            self.excel_total,
             self.template_content,
             subject,
             self.name_column,
             self.email_column,
-            self.interval_spinbox.value()
+            self.interval_spinbox.value(),
+            self.resume_checkbox.isChecked(),
+            self.attachment_files,
+            self.attachment_column,
+            self.template_slots
         )
         
         # 连接信号
@@ -625,10 +866,54 @@ class MainWindow(QMainWindow):
         self.send_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.status_label.setText("发送完成!")
-        QMessageBox.information(self, "成功", "所有邮件已发送完成!")
+        rotation = self.sender_thread.rotation
+        stats = rotation.tls_summary() if rotation is not None else []
+        if self.sender_thread.render_cache is not None:
+            stats.append(self.sender_thread.render_cache.summary())
+        if stats:
+            self.status_label.setText("发送完成! " + "；".join(stats))
+        
+        report_text = self.save_report()
+        summary = self.sender_thread.report.summary()
+        failed = summary[STATUS_FAILED] + summary[STATUS_RETRYING]
+        message = (f"发送成功 {summary[STATUS_SENT]} 封，失败 {failed} 封，"
+                   f"未发送 {summary[STATUS_PENDING]} 封。\n\n{report_text}")
+        if summary[STATUS_SKIPPED]:
+            message = f"跳过此前已发送 {summary[STATUS_SKIPPED]} 封，" + message
+        disabled = rotation.disabled_summary() if rotation is not None else []
+        if disabled:
+            message += "\n\n以下发件账户已自动停用：\n" + "\n".join(disabled)
+        if failed or summary[STATUS_PENDING] or disabled:
+            QMessageBox.warning(self, "发送完成", message)
+        else:
+            QMessageBox.information(self, "成功", f"所有邮件已发送完成!\n\n{report_text}")
+    
+    def save_report(self):
+        """保存逐行发送报告到Excel文件所在目录，返回提示信息"""
+        report_path = os.path.splitext(self.excel_path.text())[0] + \
+            f"_发送报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        try:
+            self.sender_thread.report.save_csv(report_path, self.sender_thread.recipients)
+            return f"发送报告已保存到：\n{report_path}"
+        except Exception as e:
+            return f"发送报告保存失败: {str(e)}"
     
     def handle_sending_error(self, error_msg):
+        self.send_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
         self.status_label.setText(f"错误: {error_msg}")
+        
+        # 发送中止时同样保存已有的逐行结果
+        report_text = self.save_report()
+        summary = self.sender_thread.report.summary()
+        message = (f"发送已中止: {error_msg}\n\n"
+                   f"发送成功 {summary[STATUS_SENT]} 封，失败 {summary[STATUS_FAILED] + summary[STATUS_RETRYING]} 封，"
+                   f"未发送 {summary[STATUS_PENDING]} 封。\n\n{report_text}")
+        rotation = self.sender_thread.rotation
+        disabled = rotation.disabled_summary() if rotation is not None else []
+        if disabled:
+            message += "\n\n以下发件账户已自动停用：\n" + "\n".join(disabled)
+        QMessageBox.critical(self, "发送中止", message)
     
     def test_email_config(self):
         """测试邮箱配置是否正确"""
@@ -710,14 +995,16 @@ class EmailTestDialog(QDialog):
             if self.email_sender.use_ssl:
                 server = smtplib.SMTP_SSL(
                     self.email_sender.smtp_server, 
-                    self.email_sender.smtp_port
+                    self.email_sender.smtp_port,
+                    context=self.email_sender.ssl_context
                 )
             else:
                 server = smtplib.SMTP(
                     self.email_sender.smtp_server, 
                     self.email_sender.smtp_port
                 )
-                server.starttls()
+                if self.email_sender.starttls:
+                    server.starttls(context=self.email_sender.ssl_context)
             
             # 测试登录
             self.status_label.setText("正在验证登录信息...")
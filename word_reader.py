@@ -1,30 +1,24 @@
 import docx
 from docx.opc.exceptions import PackageNotFoundError
 import os
+import hashlib
 import html
-import re
+import itertools
+import json
+import posixpath
+import zipfile
+from collections import OrderedDict
 from docx import Document
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 from bs4 import BeautifulSoup
 from docx.shared import RGBColor
+from lxml import etree
+from template_renderer import PLACEHOLDER_PATTERN
 
-class WordReader:
-    """Word文档模板读取器"""
-    
-    def read_template(self, file_path):
-        """读取Word模板并保留格式"""
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"找不到文件: {file_path}")
-            
-        try:
-            doc = Document(file_path)
-        except PackageNotFoundError:
-            raise ValueError(f"无法打开文件，可能不是有效的Word文档: {file_path}")
-        
-        variables = set()
-        html_content = []
-        
-        # 添加HTML头和CSS样式
-        html_content.append("""
+
+# 模板HTML的开头部分（HTML头和CSS样式）
+HTML_HEAD = """
         <html>
         <head>
             <meta charset="utf-8">
@@ -36,113 +30,607 @@ class WordReader:
             </style>
         </head>
         <body>
-        """)
+        """
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+OFFICE_DOCUMENT = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
+
+def _w(name):
+    return f'{{{W_NS}}}{name}'
+
+
+W_BODY, W_P, W_R, W_TBL, W_TR, W_TC = (_w(n) for n in ('body', 'p', 'r', 'tbl', 'tr', 'tc'))
+W_HYPERLINK, W_PPR, W_RPR, W_TCPR, W_TRPR = (_w(n) for n in ('hyperlink', 'pPr', 'rPr', 'tcPr', 'trPr'))
+W_VAL = _w('val')
+_W_T, _W_TAB, _W_PTAB, _W_BR, _W_CR, _W_NO_BREAK_HYPHEN, _W_TYPE = (
+    _w(n) for n in ('t', 'tab', 'ptab', 'br', 'cr', 'noBreakHyphen', 'type')
+)
+# 段落格式
+_W_JC, _W_SPACING, _W_BEFORE, _W_AFTER, _W_LINE, _W_LINE_RULE, _W_IND, _W_HANGING, _W_FIRST_LINE = (
+    _w(n) for n in ('jc', 'spacing', 'before', 'after', 'line', 'lineRule', 'ind', 'hanging', 'firstLine')
+)
+# 文字格式
+_W_R_FONTS, _W_ASCII, _W_SZ, _W_COLOR, _W_B, _W_I, _W_U = (
+    _w(n) for n in ('rFonts', 'ascii', 'sz', 'color', 'b', 'i', 'u')
+)
+# 表格单元格合并
+_W_GRID_BEFORE, _W_GRID_SPAN, _W_V_MERGE = (
+    _w(n) for n in ('gridBefore', 'gridSpan', 'vMerge')
+)
+
+# 段落对齐方式：w:jc的取值 -> CSS
+ALIGN_MAP = {'left': 'left', 'center': 'center', 'right': 'right', 'both': 'justify'}
+
+# 长度单位换算（与python-docx一致，以EMU为基本单位）
+EMU_PER_PT = 12700
+EMU_PER_TWIP = 635
+UNIVERSAL_MEASURE = {'mm': 36000, 'cm': 360000, 'in': 914400, 'pt': 12700, 'pc': 152400, 'pi': 152400}
+
+
+def _twips_emu(value, signed=False):
+    """w:spacing、w:ind等属性中的长度（默认单位为缇）转换为EMU"""
+    if 'i' in value or 'm' in value or 'p' in value:
+        return int(round(float(value[:-2]) * UNIVERSAL_MEASURE[value[-2:]]))
+    twips = int(round(float(value))) if signed else int(value)
+    return int(twips * EMU_PER_TWIP)
+
+
+def _on(element):
+    """w:b、w:i等开关属性：没有val或val为真值时为True"""
+    value = element.get(W_VAL)
+    return value is None or value in ('1', 'true', 'on')
+
+
+def _run_text(r):
+    """与python-docx的Run.text相同：文字以及制表符、换行等对应的字符"""
+    parts = []
+    for child in r:
+        tag = child.tag
+        if tag == _W_T:
+            parts.append(child.text or '')
+        elif tag == _W_TAB or tag == _W_PTAB:
+            parts.append('\t')
+        elif tag == _W_BR:
+            parts.append('\n' if child.get(_W_TYPE, 'textWrapping') == 'textWrapping' else '')
+        elif tag == _W_CR:
+            parts.append('\n')
+        elif tag == _W_NO_BREAK_HYPHEN:
+            parts.append('-')
+    return ''.join(parts)
+
+
+def _paragraph_text(p):
+    """与python-docx的Paragraph.text相同：段落中的文字，包括超链接中的文字"""
+    parts = []
+    for child in p:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(r) for r in child.iterchildren(W_R))
+    return ''.join(parts)
+
+
+def _paragraph_style(p):
+    """段落格式（对齐、间距、行距、首行缩进）对应的CSS，与WordReader原有的转换规则相同"""
+    pPr = p.find(W_PPR)
+    if pPr is None:
+        return []
+    style = []
+    jc = pPr.find(_W_JC)
+    if jc is not None:
+        style.append(f"text-align: {ALIGN_MAP.get(jc.get(W_VAL), 'left')}")
+    spacing = pPr.find(_W_SPACING)
+    if spacing is not None:
+        for attr, prop in ((_W_BEFORE, 'margin-top'), (_W_AFTER, 'margin-bottom')):
+            value = spacing.get(attr)
+            if value is not None and _twips_emu(value):
+                style.append(f"{prop}: {_twips_emu(value) / EMU_PER_PT}pt")
+        line = spacing.get(_W_LINE)
+        if line is not None:
+            emu = _twips_emu(line, signed=True)
+            # 倍数行距为浮点数（如1.5），固定行距按原有规则输出EMU数值
+            line_spacing = emu / (12 * EMU_PER_PT) if spacing.get(_W_LINE_RULE, 'auto') == 'auto' else emu
+            if line_spacing:
+                style.append(f"line-height: {line_spacing}")
+    ind = pPr.find(_W_IND)
+    if ind is not None:
+        hanging = ind.get(_W_HANGING)
+        first_line = ind.get(_W_FIRST_LINE)
+        if hanging is not None:
+            indent = -_twips_emu(hanging)
+        elif first_line is not None:
+            indent = _twips_emu(first_line)
+        else:
+            indent = 0
+        if indent:
+            style.append(f"text-indent: {indent / EMU_PER_PT}pt")
+    return style
+
+
+def _run_style(r):
+    """文字格式（字体、字号、颜色、加粗、斜体、下划线）对应的CSS"""
+    rPr = r.find(W_RPR)
+    if rPr is None:
+        return []
+    style = []
+    fonts = rPr.find(_W_R_FONTS)
+    if fonts is not None and fonts.get(_W_ASCII):
+        style.append(f"font-family: '{fonts.get(_W_ASCII)}'")
+    size = rPr.find(_W_SZ)
+    if size is not None and size.get(W_VAL):
+        value = size.get(W_VAL)
+        if 'm' in value or 'n' in value or 'p' in value:
+            emu = int(round(float(value[:-2]) * UNIVERSAL_MEASURE[value[-2:]]))
+        else:
+            emu = int(int(value) / 2.0 * EMU_PER_PT)
+        if emu:
+            style.append(f"font-size: {emu / EMU_PER_PT}pt")
+    color = rPr.find(_W_COLOR)
+    if color is not None and color.get(W_VAL) not in (None, 'auto'):
+        style.append(f"color: #{color.get(W_VAL).lower()}")
+    bold = rPr.find(_W_B)
+    if bold is not None and _on(bold):
+        style.append("font-weight: bold")
+    italic = rPr.find(_W_I)
+    if italic is not None and _on(italic):
+        style.append("font-style: italic")
+    underline = rPr.find(_W_U)
+    if underline is not None and underline.get(W_VAL) not in (None, 'none'):
+        style.append("text-decoration: underline")
+    return style
+
+
+def _paragraph_parts(p):
+    """段落的(文字, 段落格式, [(run文字, run格式)])；空段落不需要格式"""
+    text = _paragraph_text(p)
+    if not text.strip():
+        return text, [], []
+    runs = [(_run_text(r), _run_style(r)) for r in p.iterchildren(W_R)]
+    return text, _paragraph_style(p), runs
+
+
+def _table_rows(tbl):
+    """
+    表格每行各单元格中的段落，与python-docx的row.cells相同：
+    横向合并的单元格按所占列数重复，纵向合并的后续单元格取合并起始单元格的内容
+    """
+    above = {}
+    for tr in tbl.iterchildren(W_TR):
+        offset = 0
+        trPr = tr.find(W_TRPR)
+        if trPr is not None:
+            before = trPr.find(_W_GRID_BEFORE)
+            if before is not None:
+                offset = int(before.get(W_VAL, 0))
+        current = {}
+        cells = []
+        for tc in tr.iterchildren(W_TC):
+            span, merge = 1, None
+            tcPr = tc.find(W_TCPR)
+            if tcPr is not None:
+                grid_span = tcPr.find(_W_GRID_SPAN)
+                if grid_span is not None:
+                    span = int(grid_span.get(W_VAL, 1))
+                v_merge = tcPr.find(_W_V_MERGE)
+                if v_merge is not None:
+                    merge = v_merge.get(W_VAL, 'continue')
+            if merge == 'continue':
+                paragraphs = above.get(offset, [])
+            else:
+                paragraphs = [_paragraph_parts(p) for p in tc.iterchildren(W_P)]
+            current[offset] = paragraphs
+            cells.extend([paragraphs] * span)
+            offset += span
+        above = current
+        yield cells
+
+
+def merge_split_placeholders(runs):
+    """
+    Word经常把一个占位符拆分到多个run中（如"{姓"和"名}"格式不同或经过修订），
+    把跨run的占位符整体移到其开始所在的run中，使每个占位符都完整地位于一个run内
+    runs: [(文字, 格式)]，返回同样格式的列表；因此变空的run被去掉
+    """
+    text = ''.join(run_text for run_text, _ in runs)
+    # 每个字符所属的run
+    owners = []
+    for i, (run_text, _) in enumerate(runs):
+        owners.extend([i] * len(run_text))
+    changed = False
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        start, end = match.span()
+        if owners[start] != owners[end - 1]:
+            owners[start:end] = [owners[start]] * (end - start)
+            changed = True
+    if not changed:
+        return runs
+    texts = [[] for _ in runs]
+    for char, owner in zip(text, owners):
+        texts[owner].append(char)
+    return [
+        (''.join(chars), run_style)
+        for chars, (run_text, run_style) in zip(texts, runs)
+        if chars or not run_text
+    ]
+
+
+class StyleStats:
+    """样式合并的统计：生成的CSS类数，以及模板HTML在使用内联样式和CSS类时的大小（UTF-8字节数）"""
+
+    def __init__(self, classes=0, inline_bytes=0, output_bytes=0):
+        self.classes = classes
+        self.inline_bytes = inline_bytes
+        self.output_bytes = output_bytes
+
+    @property
+    def saved_bytes(self):
+        return self.inline_bytes - self.output_bytes
+
+    def summary(self):
+        if not self.inline_bytes:
+            return "样式合并: 无"
+        # 正文按base64编码发送，编码后的大小约为原来的4/3
+        return (f"样式合并为{self.classes}个类，模板HTML从{self.inline_bytes}字节减少到"
+                f"{self.output_bytes}字节（节省{self.saved_bytes / self.inline_bytes:.1%}，"
+                f"每封邮件编码后约少{self.saved_bytes * 4 // 3}字节）")
+
+
+class _TemplateHtml:
+    """
+    逐段生成模板HTML，同时记录变量和槽位索引：
+    slots为每个占位符在HTML中的(起始位置, 结束位置, 变量名)，渲染时可直接按位置拆分模板
+    style_classes为True时，重复出现的段落和文字格式合并为<style>中的CSS类，不再逐个写成内联样式
+    """
+
+    def __init__(self, style_classes=False):
+        self.parts = [HTML_HEAD]
+        self.variables = set()
+        self.style_classes = style_classes
+        # 占位符所在的片段序号和变量名，生成完成后换算为在HTML中的位置
+        self.slots = []
+        # 格式属性所在的片段序号 -> CSS声明，生成完成后决定写成内联样式还是CSS类
+        self.styles = {}
+        # CSS声明 -> 使用次数
+        self.uses = {}
+
+    def append(self, text):
+        self.parts.append(text)
+
+    def style(self, style):
+        """添加格式的CSS列表对应的属性"""
+        if style:
+            declarations = ';'.join(style)
+            self.styles[len(self.parts)] = declarations
+            self.uses[declarations] = self.uses.get(declarations, 0) + 1
+            self.parts.append('')
+
+    def text(self, text, escape=True):
+        """添加一段文字，其中的占位符记入槽位索引"""
+        convert = html.escape if escape else str
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self.append(convert(text[position:match.start()]))
+            self.slots.append((len(self.parts), match.group(1)))
+            self.append(convert(match.group(0)))
+            self.variables.add(match.group(1))
+            position = match.end()
+        self.append(convert(text[position:]))
+
+    def paragraph(self, text, style, runs):
+        """
+        一个段落：text为段落文字，style为段落格式的CSS列表，
+        runs为段落中各run的[(文字, 文字格式的CSS列表)]
+        """
+        if not text.strip():
+            # 空段落转换为换行
+            self.append("<br>")
+            return
+        self._formatted(style, runs)
+
+    def _formatted(self, style, runs):
+        """输出带格式的段落，段落中的变量按整个段落识别"""
+        self.append("<p")
+        self.style(style)
+        self.append(">")
+        for run_text, run_style in merge_split_placeholders(runs):
+            if run_style:
+                self.append("<span")
+                self.style(run_style)
+                self.append(">")
+                self.text(run_text)
+                self.append('</span>')
+            else:
+                self.text(run_text)
+        self.append("</p>")
+
+    def table(self, rows):
+        """
+        一个表格：rows为每行各单元格中的段落[(文字, 段落格式, runs)]，
+        单元格中的段落与正文段落使用相同的格式转换，空段落省略
+        """
+        self.append("<table border='1' style='width:100%; border-collapse: collapse;'>")
+        for cells in rows:
+            self.append("<tr>")
+            for paragraphs in cells:
+                self.append("<td>")
+                for text, style, runs in paragraphs:
+                    if text.strip():
+                        self._formatted(style, runs)
+                self.append("</td>")
+            self.append("</tr>")
+        self.append("</table>")
+
+    def _classes(self):
+        """
+        合并为CSS类的格式：CSS声明 -> (类名, 样式表中的规则)
+        只合并减少的字节数超过所需规则长度的格式，只出现一次的长格式仍写成内联样式
+        """
+        classes = {}
+        for declarations, count in self.uses.items():
+            name = f"w{len(classes) + 1}"
+            rule = f"                .{name} {{ {declarations}; }}\n"
+            saved = len(f' style="{declarations}"'.encode('utf-8')) - len(f' class="{name}"')
+            if count * saved > len(rule.encode('utf-8')):
+                classes[declarations] = (name, rule)
+        return classes
+
+    def result(self):
+        """返回(HTML, 变量元组, 槽位索引, 样式合并统计)"""
+        self.append("</body></html>")
+        classes = self._classes() if self.style_classes else {}
+        saved = 0
+        for index, declarations in self.styles.items():
+            inline = f' style="{declarations}"'
+            if declarations in classes:
+                self.parts[index] = f' class="{classes[declarations][0]}"'
+                saved += len(inline.encode('utf-8')) - len(self.parts[index])
+            else:
+                self.parts[index] = inline
+        if classes:
+            # CSS类加在HTML头的样式表末尾
+            rules = ''.join(rule for _, rule in classes.values())
+            end = HTML_HEAD.index("            </style>")
+            self.parts[0] = HTML_HEAD[:end] + rules + HTML_HEAD[end:]
+            saved -= len(rules.encode('utf-8'))
         
-        # 处理每个段落
-        for para in doc.paragraphs:
-            if not para.text.strip():
-                # 空段落转换为换行
-                html_content.append("<br>")
+        # 各片段在HTML中的起始位置
+        starts = [0]
+        starts.extend(itertools.accumulate(len(part) for part in self.parts))
+        slots = [(starts[index], starts[index + 1], name) for index, name in self.slots]
+        html_content = "".join(self.parts)
+        output_bytes = len(html_content.encode('utf-8'))
+        stats = StyleStats(len(classes), output_bytes + saved, output_bytes)
+        return html_content, tuple(self.variables), slots, stats
+
+
+def _main_document(package):
+    """主文档在压缩包中的路径，通常为word/document.xml"""
+    try:
+        rels = etree.fromstring(package.read('_rels/.rels'))
+    except KeyError:
+        return 'word/document.xml'
+    for rel in rels.iterchildren(f'{{{RELS_NS}}}Relationship'):
+        if rel.get('Type') == OFFICE_DOCUMENT:
+            return posixpath.normpath(rel.get('Target').lstrip('/'))
+    return 'word/document.xml'
+
+
+def parse_docx(file_path, style_classes=False):
+    """
+    快速读取Word模板：直接打开.docx压缩包，用iterparse流式解析主文档XML，
+    不经过python-docx的对象模型；段落和表格按在文档中的顺序一次遍历输出，
+    已处理的元素立即释放，内存占用与文档长度基本无关
+    生成的HTML、变量和槽位索引与WordReader使用python-docx读取的结果相同
+    style_classes为True时相同的格式合并为CSS类
+    返回(HTML, 变量元组, 槽位索引, 样式合并统计)
+    """
+    try:
+        package = zipfile.ZipFile(file_path)
+    except (zipfile.BadZipFile, OSError):
+        raise ValueError(f"无法打开文件，可能不是有效的Word文档: {file_path}")
+    
+    builder = _TemplateHtml(style_classes)
+    with package, package.open(_main_document(package)) as document:
+        for _, element in etree.iterparse(document, events=('end',), tag=(W_P, W_TBL)):
+            parent = element.getparent()
+            if parent is None or parent.tag != W_BODY:
+                # 表格中的段落在整个表格解析完成后处理
                 continue
-                
-            # 获取段落格式
-            p_format = para.paragraph_format
-            
-            # 创建样式字符串
-            style = []
-            
-            # 处理段落对齐方式
-            if p_format.alignment is not None:
-                align_map = {
-                    0: 'left',
-                    1: 'center',
-                    2: 'right',
-                    3: 'justify'
-                }
-                style.append(f"text-align: {align_map.get(p_format.alignment, 'left')}")
-            
-            # 处理段落间距
-            if p_format.space_before:
-                style.append(f"margin-top: {p_format.space_before.pt}pt")
-            if p_format.space_after:
-                style.append(f"margin-bottom: {p_format.space_after.pt}pt")
-            if p_format.line_spacing:
-                style.append(f"line-height: {p_format.line_spacing}")
-            
-            # 处理首行缩进
-            if p_format.first_line_indent:
-                style.append(f"text-indent: {p_format.first_line_indent.pt}pt")
-            
-            # 开始段落标签
-            style_str = ' style="' + ';'.join(style) + '"' if style else ''
-            html_content.append(f"<p{style_str}>")
-            
-            # 处理段落中的文本和格式
-            for run in para.runs:
-                # 获取变量
-                vars = re.findall(r'\{([^}]+)\}', run.text)
-                variables.update(vars)
-                
-                # 处理文本格式
-                text = html.escape(run.text)
-                run_style = []
-                
-                # 字体样式
-                if hasattr(run.font, 'name') and run.font.name:
-                    run_style.append(f"font-family: '{run.font.name}'")
-                
-                # 字体大小
-                if hasattr(run.font, 'size') and run.font.size:
-                    size_pt = run.font.size.pt
-                    run_style.append(f"font-size: {size_pt}pt")
-                
-                # 字体颜色
-                if hasattr(run.font, 'color') and run.font.color and run.font.color.rgb:
-                    rgb = run.font.color.rgb
-                    color = f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
-                    run_style.append(f"color: {color}")
-                
-                # 加粗
-                if run.bold:
-                    run_style.append("font-weight: bold")
-                
-                # 斜体
-                if run.italic:
-                    run_style.append("font-style: italic")
-                
-                # 下划线
-                if run.underline:
-                    run_style.append("text-decoration: underline")
-                
-                # 应用样式
-                if run_style:
-                    text = f'<span style="{";".join(run_style)}">{text}</span>'
-                
-                html_content.append(text)
-            
-            # 结束段落标签
-            html_content.append("</p>")
+            if element.tag == W_P:
+                builder.paragraph(*_paragraph_parts(element))
+            else:
+                builder.table(_table_rows(element))
+            # 释放已处理的元素
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+    
+    return builder.result()
+
+
+class WordReader:
+    """
+    Word文档模板读取器
+    解析结果（HTML和变量列表）缓存在内存和磁盘中：
+    内存中按(路径, 大小, 修改时间)缓存最近使用的cache_size个模板，文件未修改时直接返回；
+    磁盘上按文件内容的哈希值缓存在cache_dir中，程序重启或模板被复制、改名后也无需重新解析
+    fast为True时用parse_docx直接流式解析文档XML，为False时使用python-docx读取
+    style_classes为True时，相同的段落和文字格式合并为HTML头中的CSS类，减小每封邮件的大小；
+    最近读取的模板的合并效果记录在style_stats中
+    """
+    
+    # 解析结果的格式版本，转换规则变化时修改，使旧的磁盘缓存失效
+    CACHE_VERSION = 4
+    
+    def __init__(self, cache_dir=None, cache_size=8, fast=True, style_classes=False):
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.fast = fast
+        self.style_classes = style_classes
+        self.style_stats = None
+        self._cache = OrderedDict()
+    
+    def read_template(self, file_path, with_slots=False):
+        """
+        读取Word模板并保留格式，返回(HTML, 变量列表)
+        with_slots为True时返回(HTML, 变量列表, 槽位索引)，槽位索引可直接传给compile_template
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"找不到文件: {file_path}")
         
-        # 处理表格
-        for table in doc.tables:
-            html_content.append("<table border='1' style='width:100%; border-collapse: collapse;'>")
-            for row in table.rows:
-                html_content.append("<tr>")
-                for cell in row.cells:
-                    # 处理单元格内容
-                    cell_content = []
-                    for paragraph in cell.paragraphs:
-                        if paragraph.text.strip():
-                            cell_content.append(paragraph.text)
-                    
-                    html_content.append(f"<td>{' '.join(cell_content)}</td>")
-                html_content.append("</tr>")
-            html_content.append("</table>")
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        result = self._cache.get(key)
+        if result is None:
+            result = self._read_cached(file_path)
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        html_content, variables, slots, self.style_stats = result
+        if with_slots:
+            return html_content, list(variables), list(slots)
+        return html_content, list(variables)
+    
+    def _read_cached(self, file_path):
+        """按文件内容的哈希值读取磁盘缓存，没有缓存时解析文档并写入缓存"""
+        if not self.cache_dir:
+            return self._parse_template(file_path)
+        
+        # 两种输出方式的结果分别缓存
+        digest = hashlib.sha256(f"{self.CACHE_VERSION}:{self.style_classes}:".encode('ascii'))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        cache_file = os.path.join(self.cache_dir, f"word_{digest.hexdigest()}.json")
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            return (cached['html'], tuple(cached['variables']), [tuple(slot) for slot in cached['slots']],
+                    StyleStats(**cached['style_stats']))
+        except (OSError, ValueError, KeyError):
+            # 没有缓存或缓存文件损坏，重新解析
+            pass
+        
+        html_content, variables, slots, stats = self._parse_template(file_path)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # 先写入临时文件再替换，避免其他进程读到写了一半的缓存
+            temp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'html': html_content, 'variables': list(variables), 'slots': slots,
+                           'style_stats': vars(stats)}, f, ensure_ascii=False)
+            os.replace(temp_file, cache_file)
+        except OSError:
+            # 缓存写入失败不影响使用
+            pass
+        return html_content, variables, slots, stats
+    
+    def _parse_template(self, file_path):
+        """解析Word模板，返回(HTML, 变量元组, 槽位索引, 样式合并统计)"""
+        if self.fast:
+            return parse_docx(file_path, self.style_classes)
+        return self._parse_with_python_docx(file_path)
+    
+    def _parse_with_python_docx(self, file_path):
+        """使用python-docx读取Word模板"""
+        try:
+            doc = Document(file_path)
+        except PackageNotFoundError:
+            raise ValueError(f"无法打开文件，可能不是有效的Word文档: {file_path}")
+        
+        builder = _TemplateHtml(self.style_classes)
+        
+        # 按文档中的顺序处理段落和表格
+        for element in doc.element.body.iterchildren():
+            if element.tag == W_P:
+                builder.paragraph(*self._paragraph_parts(Paragraph(element, doc)))
+            elif element.tag == W_TBL:
+                table = Table(element, doc)
+                rows = []
+                for row in table.rows:
+                    # 单元格中的段落与正文段落使用相同的格式转换
+                    rows.append([
+                        [self._paragraph_parts(paragraph) for paragraph in cell.paragraphs]
+                        for cell in row.cells
+                    ])
+                builder.table(rows)
         
-        # 添加HTML尾
-        html_content.append("</body></html>")
+        return builder.result()
+
+    def _paragraph_parts(self, para):
+        """python-docx段落的(文字, 段落格式, [(run文字, run格式)])"""
+        if not para.text.strip():
+            # 空段落转换为换行，不需要格式
+            return para.text, [], []
+        
+        # 获取段落格式
+        p_format = para.paragraph_format
+
+        # 创建样式字符串
+        style = []
+
+        # 处理段落对齐方式
+        if p_format.alignment is not None:
+            align_map = {
+                0: 'left',
+                1: 'center',
+                2: 'right',
+                3: 'justify'
+            }
+            style.append(f"text-align: {align_map.get(p_format.alignment, 'left')}")
+
+        # 处理段落间距
+        if p_format.space_before:
+            style.append(f"margin-top: {p_format.space_before.pt}pt")
+        if p_format.space_after:
+            style.append(f"margin-bottom: {p_format.space_after.pt}pt")
+        if p_format.line_spacing:
+            style.append(f"line-height: {p_format.line_spacing}")
+
+        # 处理首行缩进
+        if p_format.first_line_indent:
+            style.append(f"text-indent: {p_format.first_line_indent.pt}pt")
+
+        # 处理段落中的文本和格式
+        runs = []
+        for run in para.runs:
+            # 处理文本格式
+            run_style = []
+
+            # 字体样式
+            if hasattr(run.font, 'name') and run.font.name:
+                run_style.append(f"font-family: '{run.font.name}'")
+
+            # 字体大小
+            if hasattr(run.font, 'size') and run.font.size:
+                size_pt = run.font.size.pt
+                run_style.append(f"font-size: {size_pt}pt")
+
+            # 字体颜色
+            if hasattr(run.font, 'color') and run.font.color and run.font.color.rgb:
+                rgb = run.font.color.rgb
+                color = f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
+                run_style.append(f"color: {color}")
+
+            # 加粗
+            if run.bold:
+                run_style.append("font-weight: bold")
+
+            # 斜体
+            if run.italic:
+                run_style.append("font-style: italic")
+
+            # 下划线
+            if run.underline:
+                run_style.append("text-decoration: underline")
+
+            runs.append((run.text, run_style))
         
-        return "".join(html_content), list(variables)
+        return para.text, style, runs
 
     def read_template_html(self, file_path):
         """